@@ -0,0 +1,52 @@
+# chat/gemini.py
+
+import os
+import threading
+
+# google.generativeai coûte ~0,7 s à l'import : il n'est chargé (et configuré)
+# qu'à la première requête de chat, une seule fois par processus. Les commandes
+# manage.py (migrations, etc.) et l'app météo n'en paient plus le coût.
+
+_lock = threading.Lock()
+_genai = None
+_models = {}
+
+# Exceptions de google.api_core, importées à la demande (voir __getattr__)
+_API_ERRORS = ("ResourceExhausted", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded")
+
+
+def get_genai():
+    """Module google.generativeai, importé et configuré une seule fois"""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+def get_model(model_name, system_instruction):
+    """GenerativeModel partagé par toutes les sessions du processus"""
+    key = (model_name, system_instruction)
+    model = _models.get(key)
+    if model is None:
+        genai = get_genai()
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                _models[key] = model
+    return model
+
+
+def __getattr__(name):
+    # Permet "except gemini.ResourceExhausted:" sans importer google.api_core
+    # au chargement : la clause n'est évaluée que lorsqu'une exception remonte
+    if name in _API_ERRORS:
+        from google.api_core import exceptions
+
+        return getattr(exceptions, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,79 @@
+# chat/management/commands/bench_startup.py
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Ce que fait un worker au démarrage : configuration Django + chargement des URLs (donc des vues)
+BOOT_SNIPPET = """
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+# Coût payé à la première requête de chat, une fois par processus
+GEMINI_SNIPPET = """
+from chat import gemini
+gemini.get_genai()
+from PIL import Image
+"""
+
+
+class Command(BaseCommand):
+    help = "Mesure le temps de démarrage d'un worker et affiche le profil d'import (-X importtime)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Nombre de démarrages mesurés")
+        parser.add_argument("--top", type=int, default=15, help="Nombre d'imports affichés dans le profil")
+        parser.add_argument(
+            "--with-gemini",
+            action="store_true",
+            help="Inclut l'initialisation paresseuse du client Gemini (première requête de chat)"
+        )
+
+    def handle(self, *args, **options):
+        snippet = BOOT_SNIPPET + (GEMINI_SNIPPET if options["with_gemini"] else "")
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "gemini_api.settings")}
+
+        timings = []
+        profile = ""
+        for _ in range(options["runs"]):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", snippet],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            timings.append(time.perf_counter() - started)
+            profile = completed.stderr
+
+        self.stdout.write(f"Démarrage ({options['runs']} mesures) : "
+                          f"médiane {statistics.median(timings) * 1000:.0f} ms, "
+                          f"min {min(timings) * 1000:.0f} ms")
+
+        self.stdout.write(f"\nImports les plus coûteux (cumulé, µs) :")
+        for cumulative, name in self._top_imports(profile, options["top"]):
+            self.stdout.write(f"{cumulative:>10}  {name}")
+
+    def _top_imports(self, profile, top):
+        """Imports de premier niveau du profil -X importtime, triés par temps cumulé"""
+        imports = []
+        for line in profile.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if name.startswith("  "):
+                # Import imbriqué : déjà compté dans le cumul de son parent
+                continue
+            imports.append((int(cumulative), name.strip()))
+
+        return sorted(imports, reverse=True)[:top]
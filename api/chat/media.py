@@ -0,0 +1,173 @@
+# chat/media.py
+
+import base64
+import contextvars
+import mimetypes
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from gemini_api.profiling import stage
+
+from .media_cache import content_hash, media_store
+
+# Session HTTP partagée : connexions keep-alive réutilisées entre les téléchargements
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=settings.CHAT_MEDIA_WORKERS))
+_session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=settings.CHAT_MEDIA_WORKERS))
+
+# Pool borné partagé par toutes les requêtes du processus
+_executor = ThreadPoolExecutor(max_workers=settings.CHAT_MEDIA_WORKERS, thread_name_prefix="chat-media")
+
+IMAGE_URL_TIMEOUT = 15
+AUDIO_URL_TIMEOUT = 30
+
+
+# Forme normalisée des images envoyées à Gemini : JPEG de taille bornée
+IMAGE_MAX_SIZE = 1600
+IMAGE_JPEG_QUALITY = 85
+
+
+def _normalize_image(raw_bytes):
+    with stage("image_decode"):
+        return _encode_jpeg(raw_bytes)
+
+
+def _encode_jpeg(raw_bytes):
+    from PIL import Image
+
+    img = Image.open(BytesIO(raw_bytes))
+    img.load()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def _image_part(raw_bytes):
+    """Image normalisée, servie depuis le cache si ces octets ont déjà été vus"""
+    digest = content_hash(raw_bytes)
+    cached = media_store.get(digest)
+    if cached is None:
+        cached = ("image/jpeg", _normalize_image(raw_bytes))
+        media_store.put(digest, *cached)
+    mime_type, data = cached
+    return digest, {"mime_type": mime_type, "data": data}
+
+
+def _audio_part(raw_bytes, mime_type):
+    # Pas de transcodage disponible : l'audio est conservé tel quel
+    digest = content_hash(raw_bytes)
+    cached = media_store.get(digest)
+    if cached is None:
+        cached = (mime_type, raw_bytes)
+        media_store.put(digest, *cached)
+    mime_type, data = cached
+    return digest, {"mime_type": mime_type, "data": data}
+
+
+def _cached_url_part(url):
+    """Média déjà téléchargé depuis cette URL : ni téléchargement ni décodage"""
+    digest = media_store.lookup_url(url)
+    if digest is None:
+        return None
+    cached = media_store.get(digest)
+    if cached is None:
+        return None
+    mime_type, data = cached
+    return {"mime_type": mime_type, "data": data}
+
+
+def _decode_base64(b64_data):
+    if "," in b64_data:
+        b64_data = b64_data.split(",")[1]
+    with stage("base64"):
+        return base64.b64decode(b64_data)
+
+
+def _download(url, timeout, deadline):
+    # Le délai de chaque téléchargement est plafonné par le temps restant de la requête
+    remaining = max(deadline - time.monotonic(), 0.1)
+    with stage("download"):
+        response = _session.get(url, timeout=min(timeout, remaining))
+        response.raise_for_status()
+        return response.content
+
+
+def _audio_mime_type(name, default):
+    mime_type, _ = mimetypes.guess_type(name)
+    if not mime_type or not mime_type.startswith("audio/"):
+        mime_type = default
+    return mime_type
+
+
+def image_from_file(img_file, deadline):
+    return _image_part(img_file.read())[1]
+
+
+def audio_from_file(audio_file, deadline):
+    return _audio_part(audio_file.read(), _audio_mime_type(audio_file.name, "audio/m4a"))[1]
+
+
+def image_from_url(image_url, deadline):
+    part = _cached_url_part(image_url)
+    if part is None:
+        digest, part = _image_part(_download(image_url, IMAGE_URL_TIMEOUT, deadline))
+        media_store.remember_url(image_url, digest)
+    return part
+
+
+def image_from_base64(image_b64, deadline):
+    return _image_part(_decode_base64(image_b64))[1]
+
+
+def audio_from_url(audio_url, deadline):
+    part = _cached_url_part(audio_url)
+    if part is None:
+        audio_data = _download(audio_url, AUDIO_URL_TIMEOUT, deadline)
+        digest, part = _audio_part(audio_data, _audio_mime_type(audio_url, "audio/mpeg"))
+        media_store.remember_url(audio_url, digest)
+    return part
+
+
+def audio_from_base64(audio_b64, deadline):
+    return _audio_part(_decode_base64(audio_b64), "audio/mpeg")[1]
+
+
+def acquire_media(tasks):
+    """
+    Exécute en parallèle les tâches (fonction, argument, message d'erreur) et renvoie
+    leurs résultats dans l'ordre des tâches. L'ensemble est borné par
+    CHAT_MEDIA_DEADLINE : une image + une note vocale coûtent le plus lent des deux,
+    pas la somme. Toute erreur (ou dépassement) devient un ValueError.
+    """
+    if not tasks:
+        return []
+
+    deadline = time.monotonic() + settings.CHAT_MEDIA_DEADLINE
+    # Chaque tâche s'exécute dans une copie du contexte : ses étapes comptent dans la trace de la requête
+    futures = [
+        _executor.submit(contextvars.copy_context().run, func, arg, deadline)
+        for func, arg, _ in tasks
+    ]
+
+    done, pending = wait(futures, timeout=settings.CHAT_MEDIA_DEADLINE, return_when=FIRST_EXCEPTION)
+    for future in pending:
+        future.cancel()
+
+    for future, (_, _, error_message) in zip(futures, tasks):
+        if future in done and future.exception() is not None:
+            raise ValueError(f"{error_message}: {future.exception()}")
+
+    for future, (_, _, error_message) in zip(futures, tasks):
+        if future in pending:
+            raise ValueError(f"{error_message}: délai de {settings.CHAT_MEDIA_DEADLINE}s dépassé")
+
+    return [future.result() for future in futures]
@@ -0,0 +1,170 @@
+# chat/media_cache.py
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(raw_bytes):
+    return hashlib.sha256(raw_bytes).hexdigest()
+
+
+class MediaStore:
+    """
+    Stockage sur disque des médias normalisés, adressés par le hash des octets bruts.
+
+    objects/ab/<hash>.<mime>  forme normalisée (ex. JPEG recompressé), mime encodé dans le nom
+    urls/cd/<hash de l'url>   hash du contenu déjà téléchargé pour cette URL
+
+    Éviction LRU : chaque lecture met à jour la date de modification du fichier,
+    les plus anciens sont supprimés quand la taille totale (objets et URLs)
+    dépasse max_bytes. Les URLs expirées ou dont l'objet a été évincé partent
+    avec eux.
+    """
+
+    def __init__(self, root, max_bytes, url_ttl):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.url_ttl = url_ttl
+        self._lock = threading.Lock()
+        self._total_bytes = None  # estimation, recalculée à chaque éviction
+
+    def get(self, digest):
+        """Renvoie (mime_type, données) ou None"""
+        directory = self.root / "objects" / digest[:2]
+        try:
+            path = next(directory.glob(f"{digest}.*"))
+            data = path.read_bytes()
+            os.utime(path)  # accès récent pour l'éviction LRU
+        except (StopIteration, OSError):
+            return None
+
+        mime_type = path.name.split(".", 1)[1].replace("_", "/", 1)
+        return mime_type, data
+
+    def put(self, digest, mime_type, data):
+        path = self.root / "objects" / digest[:2] / f"{digest}.{mime_type.replace('/', '_', 1)}"
+        if self._write(path, data):
+            self._account(len(data))
+
+    def lookup_url(self, url):
+        """Hash du contenu connu pour cette URL, s'il n'a pas expiré"""
+        path = self._url_path(url)
+        try:
+            if time.time() - path.stat().st_mtime > self.url_ttl:
+                return None
+            return path.read_text()
+        except OSError:
+            return None
+
+    def remember_url(self, url, digest):
+        data = digest.encode()
+        if self._write(self._url_path(url), data):
+            self._account(len(data))
+
+    def evict(self):
+        """
+        Supprime les URLs expirées, puis les objets les moins récemment utilisés
+        (et les URLs qui y mènent) jusqu'à repasser sous la limite
+        """
+        with self._lock:
+            evicted = 0
+            urls = []
+            expired_before = time.time() - self.url_ttl
+            for mtime, size, path in self._entries("urls"):
+                if mtime < expired_before and self._unlink(path):
+                    evicted += 1
+                else:
+                    urls.append((size, path))
+
+            objects = self._entries("objects")
+            total = sum(size for _, size, _ in objects) + sum(size for size, _ in urls)
+            # On descend à 90 % de la limite pour ne pas évincer à chaque écriture
+            target = self.max_bytes * 0.9
+            evicted_digests = set()
+            for _, size, path in sorted(objects):
+                if total <= target:
+                    break
+                if not self._unlink(path):
+                    continue
+                total -= size
+                evicted += 1
+                evicted_digests.add(path.name.split(".", 1)[0])
+
+            if evicted_digests:
+                for size, path in urls:
+                    try:
+                        digest = path.read_text()
+                    except OSError:
+                        continue
+                    if digest in evicted_digests and self._unlink(path):
+                        total -= size
+                        evicted += 1
+
+            self._total_bytes = total
+
+        if evicted:
+            logger.info(f"Cache médias : {evicted} fichier(s) évincé(s)")
+
+    def _url_path(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.root / "urls" / digest[:2] / digest
+
+    def _account(self, size):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += size
+            over_limit = self._total_bytes > self.max_bytes
+
+        if over_limit:
+            self.evict()
+
+    def _entries(self, kind):
+        """[(mtime, taille, chemin)] des fichiers de objects/ ou urls/"""
+        entries = []
+        for path in (self.root / kind).glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_total(self):
+        return sum(size for kind in ("objects", "urls") for _, size, _ in self._entries(kind))
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            path.unlink()
+        except OSError:
+            return False
+        return True
+
+    def _write(self, path, data):
+        """Écriture atomique (fichier temporaire puis renommage) ; un échec n'empêche pas la requête"""
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Cache médias : écriture impossible ({e})")
+            return False
+        return True
+
+
+media_store = MediaStore(
+    settings.CHAT_MEDIA_CACHE_DIR,
+    settings.CHAT_MEDIA_CACHE_MAX_BYTES,
+    settings.CHAT_MEDIA_CACHE_URL_TTL,
+)
@@ -0,0 +1,158 @@
+# chat/routing.py
+
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from . import gemini
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    """Statistiques d'un modèle, alimentées par chaque appel"""
+
+    LATENCY_SMOOTHING = 0.2  # poids de la dernière mesure dans la moyenne mobile
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.latency = None  # moyenne mobile du temps jusqu'au premier morceau (s)
+        self.last_error_at = None
+        self.last_error = None
+
+    def record_success(self, latency):
+        self.requests += 1
+        self.consecutive_errors = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.LATENCY_SMOOTHING * (latency - self.latency)
+
+    def record_failure(self, error):
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error_at = time.monotonic()
+        self.last_error = type(error).__name__
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """
+    Choisit le modèle Gemini selon le type d'entrée (texte, texte long, image, audio)
+    et bascule sur les modèles de repli en cas de surcharge ou de quota épuisé,
+    avec un backoff aléatoire entre deux tentatives.
+
+    Les statistiques par modèle reviennent dans le routage : un modèle en échec
+    répété est mis en pause (cooldown), un modèle trop lent passe après les autres.
+    """
+
+    def __init__(self, routes, fallback_models, long_text_chars=2000, max_attempts=4,
+                 backoff_base=0.5, backoff_max=4.0, cooldown=60, slow_latency=20.0):
+        self.routes = routes
+        self.fallback_models = fallback_models
+        self.long_text_chars = long_text_chars
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cooldown = cooldown
+        self.slow_latency = slow_latency
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.GEMINI_MODEL_ROUTES, settings.GEMINI_FALLBACK_MODELS, **settings.GEMINI_ROUTING)
+
+    def input_type(self, content):
+        """Type d'entrée d'un message : "audio", "image", "long_text" ou "text" """
+        mime_types = [part.get("mime_type", "") for part in content if isinstance(part, dict)]
+        if any(mime_type.startswith("audio/") for mime_type in mime_types):
+            return "audio"
+        if any(not isinstance(part, (str, dict)) for part in content) or any(
+            mime_type.startswith("image/") for mime_type in mime_types
+        ):
+            # Image PIL ou image brute (mime_type image/*)
+            return "image"
+
+        text_length = sum(len(part) for part in content if isinstance(part, str))
+        return "long_text" if text_length > self.long_text_chars else "text"
+
+    def candidates(self, input_type):
+        """Modèles à essayer, dans l'ordre : route du type d'entrée puis replis"""
+        configured = []
+        for model_name in self.routes.get(input_type, self.routes["text"]) + self.fallback_models:
+            if model_name not in configured:
+                configured.append(model_name)
+
+        now = time.monotonic()
+
+        def rank(model_name):
+            stats = self._stats.get(model_name)
+            if stats is None:
+                return (False, False, 0)
+            cooling_down = stats.consecutive_errors >= 2 and now - stats.last_error_at < self.cooldown
+            is_slow = stats.latency is not None and stats.latency > self.slow_latency
+            # Parmi les modèles en pause, le plus anciennement en échec d'abord
+            return (cooling_down, is_slow, stats.last_error_at if cooling_down else 0)
+
+        with self._lock:
+            # Tri stable : à santé égale, l'ordre configuré est conservé
+            return sorted(configured, key=rank)
+
+    def send(self, open_chat, content, stream=False):
+        """
+        Envoie le message en basculant de modèle si besoin.
+        open_chat(model_name) renvoie la session de chat à utiliser pour ce modèle.
+        Renvoie (réponse Gemini, nom du modèle utilisé).
+        """
+        candidates = self.candidates(self.input_type(content))
+        retryable = (gemini.ServiceUnavailable, gemini.ResourceExhausted)
+
+        for attempt in range(self.max_attempts):
+            model_name = candidates[attempt % len(candidates)]
+            started = time.monotonic()
+            try:
+                # En mode stream, send_message attend déjà le premier morceau :
+                # les erreurs de surcharge remontent ici, avant tout envoi au client
+                response = open_chat(model_name).send_message(content, stream=stream)
+            except retryable as e:
+                self._record(model_name, error=e)
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                logger.warning(f"Modèle {model_name} indisponible ({type(e).__name__}), "
+                               f"nouvelle tentative dans {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._record(model_name, latency=time.monotonic() - started)
+            return response, model_name
+
+    def _record(self, model_name, latency=None, error=None):
+        with self._lock:
+            stats = self._stats.setdefault(model_name, ModelStats())
+            if error is not None:
+                stats.record_failure(error)
+            else:
+                stats.record_success(latency)
+
+    def stats(self):
+        with self._lock:
+            return {model_name: stats.as_dict() for model_name, stats in self._stats.items()}
+
+
+router = ModelRouter.from_settings()
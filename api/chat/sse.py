@@ -0,0 +1,233 @@
+# chat/sse.py
+
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from gemini_api.admission import detach_slot
+from gemini_api.fastjson import sse_event
+from gemini_api.profiling import sampled_thread
+
+logger = logging.getLogger(__name__)
+
+# Marqueur de fin de réponse, envoyé tel quel ("data: [DONE]") comme avant
+DONE = object()
+
+# Fin de phrase : ponctuation finale ou retour à la ligne, espaces éventuels ensuite
+SENTENCE_END = re.compile(r"(?:[.!?…:]|\n)\s*$")
+
+
+class ReplayStream:
+    """
+    Trames SSE d'une réponse de chat, numérotées et conservées pour la reprise.
+
+    Le texte reçu de Gemini est regroupé avant d'être publié : une trame part
+    dès qu'une phrase se termine (avec un minimum de caractères), que le
+    tampon atteint coalesce_chars, ou que le plus ancien caractère en attente
+    a dépassé coalesce_window secondes.
+    """
+
+    def __init__(self, stream_id, config):
+        self.id = stream_id
+        self.config = config
+        self.finished = None
+        self._frames = []
+        self._pending = ""
+        self._pending_since = None
+        self._condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def push_text(self, text):
+        with self._condition:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+                # Les lecteurs en attente doivent raccourcir leur attente à la fenêtre
+                self._condition.notify_all()
+            self._pending += text
+            if self._should_flush():
+                self._flush_pending()
+
+    def push_event(self, data):
+        with self._condition:
+            self._flush_pending()
+            self._append(data)
+
+    def finish(self, completed):
+        with self._condition:
+            if self.done:
+                return
+            self._flush_pending()
+            if completed:
+                self._append(DONE)
+            self.finished = time.monotonic()
+            self._condition.notify_all()
+
+    def read(self, after, timeout):
+        """
+        (trames après la n-ième, flux terminé ?) en attendant au plus timeout
+        secondes. Publie le texte en attente dont la fenêtre est écoulée.
+        """
+        window = self.config["coalesce_window"]
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if len(self._frames) > after or self.done:
+                    return self._frames[after:], self.done
+
+                now = time.monotonic()
+                if self._pending and now - self._pending_since >= window:
+                    self._flush_pending()
+                    continue
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    return [], False
+                if self._pending:
+                    remaining = min(remaining, self._pending_since + window - now)
+                self._condition.wait(remaining)
+
+    def _should_flush(self):
+        pending_chars = len(self._pending)
+        return (
+            pending_chars >= self.config["coalesce_chars"]
+            or (pending_chars >= self.config["sentence_min_chars"] and SENTENCE_END.search(self._pending))
+            or time.monotonic() - self._pending_since >= self.config["coalesce_window"]
+        )
+
+    def _flush_pending(self):
+        if self._pending:
+            self._append({"text": self._pending})
+            self._pending = ""
+            self._pending_since = None
+
+    def _append(self, data):
+        event_id = f"{self.id}:{len(self._frames) + 1}"
+        if data is DONE:
+            frame = f"id: {event_id}\ndata: [DONE]\n\n".encode()
+        else:
+            frame = sse_event(data, event_id=event_id)
+        self._frames.append(frame)
+        self._condition.notify_all()
+
+
+class ReplayRegistry:
+    """Flux récents, gardés replay_ttl secondes après leur fin pour la reprise"""
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._streams = OrderedDict()
+
+    def create(self):
+        stream = ReplayStream(uuid.uuid4().hex[:16], self.config)
+        with self._lock:
+            self._purge()
+            self._streams[stream.id] = stream
+            while len(self._streams) > self.config["replay_max_streams"]:
+                self._streams.popitem(last=False)
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            self._purge()
+            return self._streams.get(stream_id)
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.done and now - stream.finished > self.config["replay_ttl"]
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+
+replay_streams = ReplayRegistry(settings.CHAT_SSE)
+
+# Pool borné des générations en cours (au-delà, elles attendent un thread libre)
+_producers = ThreadPoolExecutor(max_workers=settings.CHAT_SSE["producer_workers"], thread_name_prefix="chat-sse")
+
+
+def start_stream(produce):
+    """
+    Lance produce() dans le pool, indépendamment de la connexion du client :
+    si le client coupe, la génération continue et reste disponible pour
+    la reprise. produce() renvoie du texte (str), des événements (dict) ou DONE.
+
+    Le créneau d'admission de la requête reste occupé jusqu'à la fin de la
+    génération, pas seulement jusqu'à la déconnexion du client.
+    """
+    stream = replay_streams.create()
+    release_slot = detach_slot()
+    context = contextvars.copy_context()
+    try:
+        _producers.submit(context.run, _run_producer, produce, stream, release_slot)
+    except BaseException:
+        if release_slot is not None:
+            release_slot()
+        raise
+    return stream
+
+
+def _run_producer(produce, stream, release_slot=None):
+    try:
+        # Le travail Gemini se fait ici : ce thread compte dans le profil de la requête
+        with sampled_thread():
+            _produce_into(produce, stream)
+    finally:
+        if release_slot is not None:
+            release_slot()
+
+
+def _produce_into(produce, stream):
+    completed = False
+    try:
+        for item in produce():
+            if item is DONE:
+                completed = True
+            elif isinstance(item, str):
+                stream.push_text(item)
+            else:
+                stream.push_event(item)
+    except Exception as e:
+        logger.error(f"Flux chat {stream.id} interrompu : {e}")
+        stream.push_event({"error": "❌ Une erreur est survenue. Réessaie plus tard."})
+    finally:
+        stream.finish(completed)
+
+
+def parse_last_event_id(last_event_id):
+    """"<stream_id>:<n>" -> (stream_id, n), ou None si l'en-tête est invalide"""
+    stream_id, _, position = (last_event_id or "").strip().rpartition(":")
+    if not stream_id or not position.isdigit():
+        return None
+    return stream_id, int(position)
+
+
+def write_stream(stream, after=0):
+    """
+    Trames à envoyer au client à partir de la (after + 1)-ième, avec un
+    commentaire keepalive quand rien n'est publié pendant heartbeat secondes.
+    """
+    heartbeat = stream.config["heartbeat"]
+    position = after
+    while True:
+        frames, done = stream.read(position, heartbeat)
+        if not frames and not done:
+            yield b": keepalive\n\n"
+            continue
+
+        yield from frames
+        position += len(frames)
+        if done:
+            return
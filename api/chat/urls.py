@@ -1,8 +1,9 @@
 # chat/urls.py
 from django.urls import path
-from .views import ChatSimpleView, ChatStreamView
+from .views import ChatSimpleView, ChatStreamView, ChatModelStatsView
 
 urlpatterns = [
     path('chat/', ChatSimpleView.as_view(), name='chat'),           # ← celle qui marche dans le navigateur
     path('chat/stream/', ChatStreamView.as_view(), name='stream'),
+    path('chat/models/', ChatModelStatsView.as_view(), name='chat_models'),
 ]
\ No newline at end of file
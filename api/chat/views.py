@@ -1,22 +1,16 @@
 # chat/views.py
 
-import os
 import json
-import base64
-import requests
-import mimetypes
-import google.generativeai as genai
 from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
-from PIL import Image
-from io import BytesIO
 
-from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, InternalServerError, DeadlineExceeded
-
-# Configuration Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Client Gemini, PIL et exceptions google.api_core chargés à la demande
+from . import gemini, media, sse
+from .routing import router
+from gemini_api.fastjson import FastJSONMixin, sse_event
+from gemini_api.profiling import stage, timed_iter
 
 # Stockage des sessions de chat
 ACTIVE_CHATS = {}
@@ -43,10 +37,11 @@ Reste pratique et efficace. Pas de longues phrases motivantes inutiles.
 Si sujet hors agriculture : dis-le poliment.
 """
 
-def build_content_and_chat(request):
+def build_content(request):
     user_text = ""
     session_id = "default"
     content = []
+    media_tasks = []
 
     # === Mode multipart (Flutter) ===
     if request.content_type and 'multipart/form-data' in request.content_type:
@@ -56,23 +51,11 @@ def build_content_and_chat(request):
         if user_text:
             content.append(user_text)
 
-        # Image
+        # Image et audio préparés en parallèle
         if 'image' in request.FILES:
-            img_file = request.FILES['image']
-            try:
-                img = Image.open(img_file)
-                content.append(img)
-            except Exception as e:
-                raise ValueError(f"Image invalide: {e}")
-
-        # Audio
+            media_tasks.append((media.image_from_file, request.FILES['image'], "Image invalide"))
         if 'audio' in request.FILES:
-            audio_file = request.FILES['audio']
-            audio_data = audio_file.read()
-            mime_type, _ = mimetypes.guess_type(audio_file.name)
-            if not mime_type or not mime_type.startswith("audio/"):
-                mime_type = "audio/m4a"
-            content.append({"mime_type": mime_type, "data": audio_data})
+            media_tasks.append((media.audio_from_file, request.FILES['audio'], "Audio invalide"))
 
     # === Mode JSON (web) ===
     else:
@@ -91,108 +74,146 @@ def build_content_and_chat(request):
         if user_text:
             content.append(user_text)
 
+        # Téléchargements et décodages en parallèle, dans l'ordre d'origine
         if image_url:
-            try:
-                img_data = requests.get(image_url, timeout=15).content
-                img = Image.open(BytesIO(img_data))
-                content.append(img)
-            except Exception as e:
-                raise ValueError(f"Impossible de télécharger l'image: {e}")
-
+            media_tasks.append((media.image_from_url, image_url, "Impossible de télécharger l'image"))
         if image_b64:
-            try:
-                if "," in image_b64:
-                    image_b64 = image_b64.split(",")[1]
-                img_data = base64.b64decode(image_b64)
-                img = Image.open(BytesIO(img_data))
-                content.append(img)
-            except Exception as e:
-                raise ValueError(f"Image base64 invalide: {e}")
-
+            media_tasks.append((media.image_from_base64, image_b64, "Image base64 invalide"))
         if audio_url:
-            try:
-                audio_data = requests.get(audio_url, timeout=30).content
-                mime_type, _ = mimetypes.guess_type(audio_url)
-                if not mime_type or not mime_type.startswith("audio/"):
-                    mime_type = "audio/mpeg"
-                content.append({"mime_type": mime_type, "data": audio_data})
-            except Exception as e:
-                raise ValueError(f"Impossible de télécharger l'audio: {e}")
-
+            media_tasks.append((media.audio_from_url, audio_url, "Impossible de télécharger l'audio"))
         if audio_b64:
-            try:
-                if "," in audio_b64:
-                    audio_b64 = audio_b64.split(",")[1]
-                audio_data = base64.b64decode(audio_b64)
-                content.append({"mime_type": "audio/mpeg", "data": audio_data})
-            except Exception as e:
-                raise ValueError(f"Audio base64 invalide: {e}")
+            media_tasks.append((media.audio_from_base64, audio_b64, "Audio base64 invalide"))
+
+    content.extend(media.acquire_media(media_tasks))
 
     if not content:
         raise ValueError("Envoie un message, une photo ou une note vocale.")
 
-    # Création ou récupération du chat
-    if session_id not in ACTIVE_CHATS:
-        model = genai.GenerativeModel(
-            "gemini-2.5-flash-lite",  # Plus stable pour les quotas
-            system_instruction=system_instruction,
-        )
-        ACTIVE_CHATS[session_id] = model.start_chat()
+    return content, session_id
+
 
-    chat = ACTIVE_CHATS[session_id]
-    return chat, content, session_id
+def _open_chat(session_id, model_name):
+    """
+    Création ou récupération du chat sur le modèle choisi par le routeur.
+    Si le modèle change, l'historique de la session est conservé.
+    """
+    chat = ACTIVE_CHATS.get(session_id)
+    if chat is None or chat.model.model_name.removeprefix("models/") != model_name:
+        history = chat.history if chat is not None else None
+        chat = gemini.get_model(model_name, system_instruction).start_chat(history=history)
+        ACTIVE_CHATS[session_id] = chat
+    return chat
 
 
-class ChatSimpleView(APIView):
+def send_to_gemini(content, session_id, stream=False):
+    """Envoie le message via le routeur de modèles (replis et nouvelles tentatives)"""
+    return router.send(lambda model_name: _open_chat(session_id, model_name), content, stream=stream)
+
+
+def generate_once(content, stream=False):
+    """Requête isolée, sans session ni historique (ex. alertes météo), via le routeur"""
+    return router.send(
+        lambda model_name: gemini.get_model(model_name, system_instruction).start_chat(),
+        content,
+        stream=stream
+    )
+
+
+class ChatSimpleView(FastJSONMixin, APIView):
     parser_classes = [JSONParser, FormParser, MultiPartParser]
 
     def post(self, request):
         try:
-            chat, content, session_id = build_content_and_chat(request)
-            response = chat.send_message(content, stream=False)
+            with stage("content"):
+                content, session_id = build_content(request)
+            with stage("gemini"):
+                response, model_name = send_to_gemini(content, session_id, stream=False)
             return Response({
                 "response": response.text,
-                "session_id": session_id
+                "session_id": session_id,
+                "model": model_name
             })
         except ValueError as e:
             return Response({"error": str(e)}, status=400)
-        except ResourceExhausted:
+        except gemini.ResourceExhausted:
             return Response({"error": "⚠️ Limite quotidienne atteinte. Réessaie demain."}, status=429)
         except Exception as e:
             return Response({"error": "❌ Erreur temporaire du serveur IA."}, status=500)
 
 
-class ChatStreamView(APIView):
+class ChatStreamView(FastJSONMixin, APIView):
+    """
+    Réponse Gemini en SSE, regroupée par phrases, avec keepalive.
+
+    Chaque trame porte "id: <stream_id>:<n>". Après une coupure, renvoyer la
+    requête avec l'en-tête Last-Event-ID pour recevoir la suite du même flux
+    (corps ignoré) tant qu'il est conservé côté serveur (CHAT_SSE["replay_ttl"]).
+    """
     parser_classes = [JSONParser, FormParser, MultiPartParser]
 
     def post(self, request):
-        def event_stream():
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id:
+            return self._resume(last_event_id)
+
+        # Médias lus avant de rendre la réponse : les fichiers envoyés sont fermés avec elle
+        try:
+            with stage("content"):
+                content, session_id = build_content(request)
+        except ValueError as e:
+            return self._event_response(iter([sse_event({'error': str(e)})]))
+
+        def produce():
             try:
-                chat, content, session_id = build_content_and_chat(request)
-                response = chat.send_message(content, stream=True)
+                with stage("gemini"):
+                    response, model_name = send_to_gemini(content, session_id, stream=True)
 
-                for chunk in response:
+                for chunk in timed_iter("gemini_stream", response):
                     if chunk.text:
-                        yield f"data: {json.dumps({'text': chunk.text})}\n\n"
+                        yield chunk.text
 
-                yield "data: [DONE]\n\n"
+                yield sse.DONE
 
-            except ResourceExhausted:
+            except gemini.ResourceExhausted:
                 error_msg = "⚠️ Limite quotidienne atteinte.\nRéessaie demain ou dans quelques heures. Merci pour ta patience !"
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
+                yield {'error': error_msg}
 
-            except (ServiceUnavailable, InternalServerError, DeadlineExceeded) as e:
+            except (gemini.ServiceUnavailable, gemini.InternalServerError, gemini.DeadlineExceeded) as e:
                 if "overloaded" in str(e).lower():
                     error_msg = "⏳ Serveur IA temporairement surchargé.\nRéessaie dans quelques minutes."
                 else:
                     error_msg = "❌ Erreur temporaire du serveur IA.\nRéessaie bientôt."
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-
-            except ValueError as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
-            except Exception as e:
-                error_msg = "❌ Une erreur est survenue. Réessaie plus tard."
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-
-        return StreamingHttpResponse(event_stream(), content_type="text/event-stream")
\ No newline at end of file
+                yield {'error': error_msg}
+
+        stream = sse.start_stream(produce)
+        response = self._event_response(sse.write_stream(stream))
+        response["X-Stream-Id"] = stream.id
+        return response
+
+    def _resume(self, last_event_id):
+        parsed = sse.parse_last_event_id(last_event_id)
+        stream = sse.replay_streams.get(parsed[0]) if parsed else None
+        if stream is None:
+            error_msg = "Cette réponse n'est plus disponible. Renvoie ton message."
+            return self._event_response(iter([sse_event({'error': error_msg})]))
+
+        response = self._event_response(sse.write_stream(stream, after=parsed[1]))
+        response["X-Stream-Id"] = stream.id
+        return response
+
+    def _event_response(self, frames):
+        response = StreamingHttpResponse(frames, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # pas de mise en tampon par un proxy nginx
+        return response
+
+
+class ChatModelStatsView(FastJSONMixin, APIView):
+    """
+    Statistiques par modèle Gemini (requêtes, erreurs, latence) utilisées par le routeur
+    
+    GET /api/chat/models/
+    """
+
+    def get(self, request):
+        return Response({"models": router.stats()})
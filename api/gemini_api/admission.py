@@ -0,0 +1,267 @@
+# gemini_api/admission.py
+
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .profiling import stage
+from .streams import OnCloseStream
+
+logger = logging.getLogger(__name__)
+
+# Créneau d'admission de la requête en cours (voir detach_slot)
+_current_slot = contextvars.ContextVar("admission_slot", default=None)
+
+# Au-delà de cette taille, un multipart du chat contient forcément une image ou un audio
+CHAT_MEDIA_MIN_BYTES = 16 * 1024
+
+# Marqueurs des champs médias dans le JSON du chat (image_url, image_base64, audio_*)
+CHAT_MEDIA_MARKERS = (b'"image_url"', b'"image_base64"', b'"audio_url"', b'"audio_base64"')
+
+
+class CostClassGate:
+    """
+    Limite de concurrence d'une classe de coût, avec une file d'attente bornée.
+
+    Une requête est refusée tout de suite si la file est pleine, ou si l'attente
+    estimée (requêtes devant elle x durée moyenne) dépasse max_wait : mieux vaut
+    un 503 immédiat qu'un timeout côté client après avoir occupé un worker.
+    """
+
+    def __init__(self, name, concurrency, queue, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_duration = None  # secondes, moyenne mobile exponentielle
+        self.avg_wait = 0.0
+
+    def estimated_wait(self):
+        """Attente estimée pour une nouvelle requête, en secondes"""
+        if self.active < self.concurrency:
+            return 0.0
+        return (self.waiting + 1) / self.concurrency * (self.avg_duration or 0.0)
+
+    def acquire(self):
+        """Vrai si la requête est admise (l'appelant doit alors appeler release)"""
+        started = time.monotonic()
+        with self._condition:
+            if self.active >= self.concurrency and (
+                self.waiting >= self.queue or self.estimated_wait() > self.max_wait
+            ):
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self.active < self.concurrency, timeout=self.max_wait
+                )
+            finally:
+                self.waiting -= 1
+
+            if not admitted:
+                self.rejected += 1
+                return False
+
+            self.active += 1
+            self.admitted += 1
+            self.avg_wait = 0.9 * self.avg_wait + 0.1 * (time.monotonic() - started)
+            return True
+
+    def release(self, duration):
+        with self._condition:
+            self.active -= 1
+            if self.avg_duration is None:
+                self.avg_duration = duration
+            else:
+                self.avg_duration = 0.9 * self.avg_duration + 0.1 * duration
+            self._condition.notify()
+
+    def retry_after(self):
+        """Délai conseillé au client (en-tête Retry-After), en secondes entières"""
+        with self._condition:
+            estimate = (self.waiting + 1) / self.concurrency * (self.avg_duration or 1.0)
+        return min(max(math.ceil(estimate), 1), 60)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_duration_ms": round((self.avg_duration or 0.0) * 1000, 1),
+                "avg_wait_ms": round(self.avg_wait * 1000, 1),
+            }
+
+
+def _request_coordinates(request):
+    if request.method == "GET":
+        latitude = request.GET.get("latitude")
+        longitude = request.GET.get("longitude")
+    else:
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        latitude = data.get("latitude")
+        longitude = data.get("longitude")
+
+    try:
+        return float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+
+
+def _classify_weather_coordinates(request):
+    from weather.services import WeatherService
+
+    coordinates = _request_coordinates(request)
+    if coordinates and WeatherService.has_cached_weather(*coordinates):
+        return "weather-cached"
+    return "weather-miss"
+
+
+def _classify_chat(request):
+    content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    if request.content_type and "multipart/form-data" in request.content_type:
+        # Sans parser le multipart : seule la taille trahit la présence d'un fichier
+        return "chat-media" if content_length > CHAT_MEDIA_MIN_BYTES else "chat-text"
+
+    body = request.body
+    if any(marker in body for marker in CHAT_MEDIA_MARKERS):
+        return "chat-media"
+    return "chat-text"
+
+
+# Endpoints soumis au contrôle d'admission. Les abonnements SSE longue durée
+# (/api/weather/alerts/stream/) et les endpoints de service n'y sont pas soumis.
+ROUTE_CLASSIFIERS = {
+    "/api/weather/coordinates/": _classify_weather_coordinates,
+    "/api/weather/city/": lambda request: "weather-miss",
+    "/api/weather/stream/": lambda request: "weather-miss",
+    "/api/weather/sync/": lambda request: "weather-miss",
+    "/api/weather/rollup/": lambda request: "weather-miss",
+    "/api/chat/": _classify_chat,
+    "/api/chat/stream/": _classify_chat,
+}
+
+
+def classify_request(request):
+    """Classe de coût de la requête, ou None si elle n'est pas limitée"""
+    if request.method == "OPTIONS":
+        return None
+    classifier = ROUTE_CLASSIFIERS.get(request.path)
+    return classifier(request) if classifier else None
+
+
+gates = {
+    name: CostClassGate(name, **limits)
+    for name, limits in settings.ADMISSION_CONTROL["classes"].items()
+}
+
+
+def admission_stats():
+    return {name: gate.stats() for name, gate in gates.items()}
+
+
+class AdmissionSlot:
+    """Créneau occupé par une requête admise ; release() est idempotent"""
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.started = time.monotonic()
+        self.detached = False
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.gate.release(time.monotonic() - self.started)
+
+    def release_with_response(self):
+        # Créneau transféré à un travail de fond : c'est lui qui le libérera
+        if not self.detached:
+            self.release()
+
+
+def detach_slot():
+    """
+    Transfère le créneau de la requête en cours à un travail qui lui survit
+    (ex. génération du chat poursuivie après la déconnexion du client) :
+    la fin de la réponse ne le libère plus, l'appelant doit appeler la
+    fonction renvoyée. Renvoie None si la requête n'occupe pas de créneau.
+    """
+    slot = _current_slot.get()
+    if slot is None:
+        return None
+    slot.detached = True
+    return slot.release
+
+
+class AdmissionControlMiddleware:
+    """
+    Contrôle d'admission par classe de coût (weather-cached, weather-miss,
+    chat-text, chat-media) : chaque classe a sa propre limite de concurrence,
+    donc une rafale de photos ne peut plus affamer la météo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.ADMISSION_CONTROL["enabled"]:
+            return self.get_response(request)
+
+        cost_class = classify_request(request)
+        gate = gates.get(cost_class)
+        if gate is None:
+            return self.get_response(request)
+
+        with stage("admission"):
+            admitted = gate.acquire()
+
+        if not admitted:
+            retry_after = gate.retry_after()
+            logger.warning(f"Admission refusée ({cost_class}), nouvel essai dans {retry_after}s")
+            response = JsonResponse(
+                {"error": "Serveur surchargé, réessaie dans quelques instants", "cost_class": cost_class},
+                status=503
+            )
+            response["Retry-After"] = str(retry_after)
+            return response
+
+        slot = AdmissionSlot(gate)
+        token = _current_slot.set(slot)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            slot.release_with_response()
+            raise
+        finally:
+            _current_slot.reset(token)
+
+        if response.streaming:
+            response.streaming_content = OnCloseStream(response.streaming_content, slot.release_with_response)
+        else:
+            slot.release_with_response()
+        return response
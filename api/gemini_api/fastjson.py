@@ -0,0 +1,57 @@
+# gemini_api/fastjson.py
+
+import orjson
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+
+# Rendu JSON rapide (orjson) pour les endpoints chauds (météo, chat).
+# FastJSONMixin n'est actif qu'avec FAST_JSON_RESPONSES ; sinon le rendu DRF
+# habituel est utilisé. dumps() et sse_event() utilisent toujours orjson
+# (trames SSE, jetons de synchronisation) : leur format ne dépend pas du réglage.
+
+
+def dumps(data):
+    """Sérialise en JSON compact UTF-8 (bytes)"""
+    return orjson.dumps(data)
+
+
+def sse_event(data, event_id=None):
+    """Trame SSE "data: {...}" prête à envoyer, précédée de "id: ..." si fourni"""
+    frame = b"data: " + orjson.dumps(data) + b"\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n".encode() + frame
+    return frame
+
+
+class FastJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return orjson.dumps(data)
+
+
+class FastJSONMixin:
+    """
+    Pour les APIView chaudes : toujours du JSON sérialisé par orjson, sans
+    négociation de contenu (jamais de 406, quel que soit l'en-tête Accept).
+    """
+
+    def get_renderers(self):
+        if settings.FAST_JSON_RESPONSES:
+            return [FastJSONRenderer()]
+        return super().get_renderers()
+
+    def perform_content_negotiation(self, request, force=False):
+        if settings.FAST_JSON_RESPONSES:
+            return FastJSONRenderer(), FastJSONRenderer.media_type
+        return super().perform_content_negotiation(request, force)
+
+
+def json_bytes_response(body, status=200):
+    """Réponse à partir d'octets JSON déjà sérialisés (aucun rendu à la volée)"""
+    return HttpResponse(body, status=status, content_type="application/json")
@@ -0,0 +1,279 @@
+# gemini_api/profiling.py
+
+import contextvars
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+
+from .streams import OnCloseStream
+
+logger = logging.getLogger(__name__)
+
+# Profilage à la demande : une requête est tracée si elle porte l'en-tête
+# X-Profile-Token (jeton admin) ou si elle est tirée au sort (sample_rate).
+# Requête non tracée : stage() et timed_iter() ne coûtent qu'une lecture de contextvar.
+
+PROFILE_HEADER = "X-Profile-Token"
+TRACES_PATH_PREFIX = "/api/profiling/"  # la consultation des traces n'est jamais tracée
+TOP_STACKS = 15  # piles les plus fréquentes conservées par trace
+MAX_STACK_DEPTH = 12  # frames conservées par pile, côté feuille
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Étapes chronométrées et échantillons de pile d'une requête"""
+
+    def __init__(self, method, path, reason):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._samples = Counter()
+
+    def add_stage(self, name, duration):
+        # Appelé aussi depuis les threads du pool médias : temps cumulés
+        with self._lock:
+            total, count = self._stages.get(name, (0.0, 0))
+            self._stages[name] = (total + duration, count + 1)
+
+    def add_sample(self, stack):
+        with self._lock:
+            self._samples[stack] += 1
+
+    def finish(self, status):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+            self.status = status
+
+    def summary(self):
+        with self._lock:
+            stages = dict(self._stages)
+            samples = Counter(self._samples)
+        total_samples = sum(samples.values())
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "reason": self.reason,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "stages": {
+                name: {"ms": round(total * 1000, 1), "count": count}
+                for name, (total, count) in sorted(stages.items(), key=lambda item: -item[1][0])
+            },
+            "samples": total_samples,
+            "profile": [
+                {"stack": " > ".join(stack), "samples": count, "percent": round(count / total_samples * 100, 1)}
+                for stack, count in samples.most_common(TOP_STACKS)
+            ],
+        }
+
+
+@contextmanager
+def stage(name):
+    """Chronomètre une étape de la requête tracée en cours (sans effet sinon)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, time.perf_counter() - started)
+
+
+def timed_iter(name, iterable):
+    """
+    Chronomètre uniquement l'attente de chaque élément (ex. morceaux du flux
+    Gemini), pas le temps passé par l'appelant entre deux éléments.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return iterable
+    return _timed_iter(trace, name, iter(iterable))
+
+
+def _timed_iter(trace, name, iterator):
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            trace.add_stage(name, time.perf_counter() - started)
+            return
+        trace.add_stage(name, time.perf_counter() - started)
+        yield item
+
+
+class StackSampler:
+    """
+    Thread unique qui relève la pile des threads tracés (sys._current_frames)
+    à intervalle régulier. Il ne tourne que tant qu'une requête est tracée.
+    Une trace peut couvrir plusieurs threads : celui de la requête et ceux
+    qui travaillent pour elle (voir sampled_thread).
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._threads = {}  # thread_id -> trace
+        self._thread = None
+
+    def register(self, trace, thread_id):
+        with self._lock:
+            self._threads[thread_id] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def unregister(self, trace, thread_id):
+        with self._lock:
+            if self._threads.get(thread_id) is trace:
+                del self._threads[thread_id]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._threads:
+                    self._thread = None
+                    return
+                threads = list(self._threads.items())
+
+            frames = sys._current_frames()
+            for thread_id, trace in threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    trace.add_sample(_stack_key(frame))
+            del frames
+
+            time.sleep(self.interval)
+
+
+@contextmanager
+def sampled_thread():
+    """
+    Échantillonne aussi le thread courant pour la requête tracée du contexte
+    (ex. thread producteur du flux de chat, qui fait le travail Gemini pendant
+    que le thread de la requête ne fait qu'attendre).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    sampler.register(trace, thread_id)
+    try:
+        yield
+    finally:
+        sampler.unregister(trace, thread_id)
+
+
+def _stack_key(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+sampler = StackSampler(settings.REQUEST_PROFILING["sample_interval"])
+
+# Dernières traces lentes (ou demandées explicitement), les plus récentes à droite
+slow_traces = deque(maxlen=settings.REQUEST_PROFILING["max_traces"])
+
+
+def is_admin_request(request):
+    """Vrai si la requête porte le jeton admin de profilage (jeton vide = désactivé)"""
+    token = settings.REQUEST_PROFILING["admin_token"]
+    provided = request.headers.get(PROFILE_HEADER)
+    return bool(token and provided and hmac.compare_digest(provided, token))
+
+
+def recent_traces():
+    return [trace.summary() for trace in reversed(slow_traces)]
+
+
+class ProfilingMiddleware:
+    """
+    Trace une requête (étapes + profil échantillonné) sur demande admin ou par
+    tirage au sort. Les flux (SSE) sont tracés jusqu'à leur fermeture.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.REQUEST_PROFILING
+        if request.path.startswith(TRACES_PATH_PREFIX):
+            return self.get_response(request)
+        if is_admin_request(request):
+            reason = "header"
+        elif config["sample_rate"] and random.random() < config["sample_rate"]:
+            reason = "sampled"
+        else:
+            return self.get_response(request)
+
+        trace = RequestTrace(request.method, request.path, reason)
+        _current_trace.set(trace)
+        sampler.register(trace, trace.thread_id)
+
+        def finish(status):
+            if trace.duration is not None:
+                return
+            trace.finish(status)
+            sampler.unregister(trace, trace.thread_id)
+            _current_trace.set(None)
+            if reason == "header" or trace.duration * 1000 >= config["slow_ms"]:
+                slow_traces.append(trace)
+                logger.info(f"Trace {trace.id} : {request.method} {request.path} en {trace.duration * 1000:.0f} ms")
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            finish(500)
+            raise
+
+        response["X-Profile-Id"] = trace.id
+        if response.streaming:
+            response.streaming_content = OnCloseStream(
+                response.streaming_content, lambda: finish(response.status_code)
+            )
+        else:
+            finish(response.status_code)
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Réponses DRF : le rendu JSON (JSONRenderer ou orjson) se fait après la
+        vue, juste après ce hook ; chronométré jusqu'au callback post-rendu.
+        """
+        trace = _current_trace.get()
+        if trace is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: trace.add_stage("render", time.perf_counter() - started)
+            )
+        return response
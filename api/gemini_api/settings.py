@@ -58,7 +58,83 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
         'TIMEOUT': 1800,  # 30 minutes
-    }
+    },
+    # Tuiles météo précalculées (manage.py precompute_alerts), partagées entre
+    # les processus : à remplacer par Redis/Memcached en production multi-machines
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'tile_cache',
+        'TIMEOUT': 1800,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Abonnements SSE aux alertes météo
+WEATHER_ALERTS_REFRESH_INTERVAL = 900  # secondes entre deux rafraîchissements d'une tuile abonnée
+WEATHER_SSE_HEARTBEAT = 15  # secondes entre deux keepalive sur un flux inactif
+
+# Routage des modèles Gemini (chat) : modèles par type d'entrée, puis replis
+GEMINI_MODEL_ROUTES = {
+    "text": ["gemini-2.5-flash-lite"],  # Plus stable pour les quotas
+    "long_text": ["gemini-2.5-flash", "gemini-2.5-flash-lite"],
+    "image": ["gemini-2.5-flash", "gemini-2.5-flash-lite"],
+    "audio": ["gemini-2.5-flash", "gemini-2.5-flash-lite"],
+}
+GEMINI_FALLBACK_MODELS = ["gemini-2.0-flash", "gemini-2.5-flash"]
+GEMINI_ROUTING = {
+    "long_text_chars": 2000,  # au-delà, le message est traité comme "long_text"
+    "max_attempts": 4,  # tentatives au total, tous modèles confondus
+    "backoff_base": 0.5,  # secondes, doublé à chaque tentative (avec jitter)
+    "backoff_max": 4.0,
+    "cooldown": 60,  # secondes de pause pour un modèle en échec répété
+    "slow_latency": 20.0,  # secondes avant le premier morceau au-delà desquelles un modèle passe après les autres
+}
+
+# Médias du chat (images, notes vocales) : téléchargés et décodés en parallèle
+CHAT_MEDIA_WORKERS = 8  # taille du pool partagé par le processus
+CHAT_MEDIA_DEADLINE = 30  # secondes pour l'ensemble des médias d'une requête
+
+# Cache disque des médias normalisés, adressé par le hash du contenu (LRU)
+CHAT_MEDIA_CACHE_DIR = BASE_DIR / 'media_cache'
+CHAT_MEDIA_CACHE_MAX_BYTES = 500 * 1024 * 1024  # 500 Mo
+CHAT_MEDIA_CACHE_URL_TTL = 86400  # secondes pendant lesquelles une URL est supposée inchangée
+
+# SSE du chat : regroupement du texte, keepalive et reprise via Last-Event-ID
+CHAT_SSE = {
+    "coalesce_chars": 200,  # trame envoyée dès que le texte en attente atteint cette taille
+    "coalesce_window": 0.3,  # secondes d'attente maximale d'un morceau de texte
+    "sentence_min_chars": 40,  # fin de phrase : envoi immédiat au-delà de cette taille
+    "heartbeat": 15,  # secondes sans trame avant un commentaire keepalive
+    "replay_ttl": 300,  # secondes de conservation d'un flux terminé pour la reprise
+    "replay_max_streams": 500,
+    "producer_workers": 16,  # générations Gemini simultanées par processus
+}
+
+# Rendu JSON rapide (orjson, réponses météo pré-sérialisées) sur les endpoints chauds.
+# Désactivé par défaut (l'API navigable DRF reste disponible) ; à activer par
+# déploiement avec FAST_JSON_RESPONSES=1.
+FAST_JSON_RESPONSES = os.getenv('FAST_JSON_RESPONSES', '0') == '1'
+
+# Contrôle d'admission par classe de coût : requêtes simultanées, file d'attente
+# et attente maximale (secondes) avant un 503 avec Retry-After
+ADMISSION_CONTROL = {
+    "enabled": True,
+    "classes": {
+        "weather-cached": {"concurrency": 64, "queue": 128, "max_wait": 0.5},
+        "weather-miss": {"concurrency": 16, "queue": 32, "max_wait": 5.0},
+        "chat-text": {"concurrency": 8, "queue": 16, "max_wait": 10.0},
+        "chat-media": {"concurrency": 4, "queue": 4, "max_wait": 10.0},
+    },
+}
+
+# Profilage à la demande : en-tête X-Profile-Token (jeton admin) ou tirage au sort.
+# Traces consultables sur /api/profiling/traces/ avec le même en-tête.
+REQUEST_PROFILING = {
+    "admin_token": os.getenv('PROFILING_TOKEN', ''),  # vide = profilage admin désactivé
+    "sample_rate": 0.0,  # fraction des requêtes tracées (ex. 0.01)
+    "slow_ms": 1000,  # seuil de conservation d'une trace échantillonnée
+    "max_traces": 50,  # traces conservées (les plus récentes)
+    "sample_interval": 0.005,  # secondes entre deux relevés de pile
 }
 
 
@@ -71,6 +147,8 @@ CORS_ALLOW_METHODS = ['GET', 'POST', 'OPTIONS']
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'gemini_api.profiling.ProfilingMiddleware',
+    'gemini_api.admission.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -0,0 +1,27 @@
+# gemini_api/streams.py
+
+
+class OnCloseStream:
+    """
+    Enveloppe le contenu d'une StreamingHttpResponse et appelle on_close à la
+    fin du flux. close() est appelé par le serveur même si le client coupe
+    avant le premier morceau, ce qu'un générateur avec finally ne garantit pas.
+    on_close peut donc être appelé plusieurs fois : il doit être idempotent.
+    """
+
+    def __init__(self, streaming_content, on_close):
+        self._iterator = iter(streaming_content)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self._on_close()
+            raise
+
+    def close(self):
+        self._on_close()
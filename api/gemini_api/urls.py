@@ -18,8 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .views import AdmissionStatsView, ProfilingTracesView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('chat.urls')),
     path('api/weather/', include('weather.urls')),
+    path('api/admission/', AdmissionStatsView.as_view(), name='admission_stats'),
+    path('api/profiling/traces/', ProfilingTracesView.as_view(), name='profiling_traces'),
 ]
@@ -0,0 +1,43 @@
+# gemini_api/views.py
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+
+from .admission import admission_stats
+from .fastjson import FastJSONMixin
+from .profiling import is_admin_request, recent_traces
+
+
+class AdmissionStatsView(FastJSONMixin, APIView):
+    """
+    État du contrôle d'admission par classe de coût (en cours, en attente, refus)
+
+    GET /api/admission/
+    """
+
+    def get(self, request):
+        return Response({"classes": admission_stats()})
+
+
+class ProfilingTracesView(FastJSONMixin, APIView):
+    """
+    Dernières traces lentes : étapes chronométrées et piles les plus fréquentes.
+    Réservé aux requêtes portant l'en-tête X-Profile-Token.
+
+    GET /api/profiling/traces/
+    GET /api/profiling/traces/?id=<X-Profile-Id>
+    """
+
+    def get(self, request):
+        if not is_admin_request(request):
+            return Response({"error": "Accès réservé aux administrateurs"}, status=403)
+
+        traces = recent_traces()
+        trace_id = request.query_params.get("id")
+        if trace_id:
+            traces = [trace for trace in traces if trace["id"] == trace_id]
+            if not traces:
+                return Response({"error": "Trace introuvable"}, status=404)
+            return Response(traces[0])
+
+        return Response({"traces": traces})
@@ -0,0 +1,179 @@
+# weather/aggregation.py
+
+import time
+from datetime import datetime
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+MAX_FORECAST_DAYS = 5
+
+
+def _local_day_index(timestamps):
+    """
+    Numéro de jour local (même découpage que datetime.fromtimestamp)
+    calculé en une seule passe vectorisée.
+    """
+    first_offset = time.localtime(int(timestamps.min())).tm_gmtoff
+    last_offset = time.localtime(int(timestamps.max())).tm_gmtoff
+
+    if first_offset == last_offset:
+        offsets = first_offset
+    else:
+        # Changement d'heure dans la fenêtre : décalage calculé par entrée
+        offsets = np.array([time.localtime(int(ts)).tm_gmtoff for ts in timestamps], dtype=np.int64)
+
+    return (timestamps + offsets) // SECONDS_PER_DAY
+
+
+def _padded(values, group_starts, group_sizes, n_groups, width, fill):
+    """Place les valeurs de chaque groupe sur une ligne d'une matrice (n_groups, width)"""
+    matrix = np.full((n_groups, width), fill, dtype=np.float64)
+    columns = np.arange(len(values)) - np.repeat(group_starts, group_sizes)
+    matrix[np.repeat(np.arange(n_groups), group_sizes), columns] = values
+    return matrix
+
+
+def _sequential_sum(matrix):
+    """
+    Somme ligne par ligne dans l'ordre des colonnes, comme sum() en Python,
+    pour obtenir exactement les mêmes arrondis que la version par localisation.
+    """
+    total = np.zeros(matrix.shape[0], dtype=np.float64)
+    for column in range(matrix.shape[1]):
+        total += matrix[:, column]
+    return total
+
+
+def _modes(codes, groups, n_groups):
+    """
+    Valeur la plus fréquente par groupe ; en cas d'égalité, celle apparue en premier.
+    """
+    n_codes = int(codes.max()) + 1
+    keys = groups * n_codes + codes
+    unique_keys, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+    unique_groups = unique_keys // n_codes
+
+    order = np.lexsort((first_index, -counts, unique_groups))
+    sorted_groups = unique_groups[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = sorted_groups[1:] != sorted_groups[:-1]
+
+    modes = np.empty(n_groups, dtype=np.int64)
+    modes[sorted_groups[is_first]] = (unique_keys[order] % n_codes)[is_first]
+    return modes
+
+
+def _encode(labels):
+    """Codes entiers (ordre de première apparition) pour une liste de libellés"""
+    codebook = {}
+    codes = np.fromiter((codebook.setdefault(label, len(codebook)) for label in labels), dtype=np.int64, count=len(labels))
+    return list(codebook), codes
+
+
+def aggregate_forecasts(forecast_lists, day_name):
+    """
+    Agrège en une passe les prévisions 3-horaires de plusieurs localisations.
+
+    forecast_lists : liste de listes "list" brutes renvoyées par /forecast
+    day_name : fonction datetime -> libellé du jour (WeatherService._get_day_name)
+
+    Renvoie, pour chaque localisation, la même liste de prévisions journalières
+    que WeatherService._aggregate_forecast.
+    """
+    results = [[] for _ in forecast_lists]
+    items = [item for forecast in forecast_lists for item in forecast]
+    if not items:
+        return results
+
+    location = np.repeat(np.arange(len(forecast_lists)), [len(forecast) for forecast in forecast_lists])
+
+    # Une seule passe Python sur les entrées brutes, le reste est vectorisé
+    rows = []
+    icons = []
+    descriptions = []
+    for item in items:
+        main = item["main"]
+        weather = item["weather"][0]
+        rows.append((
+            item["dt"], main["temp"], main["temp_min"], main["temp_max"], main["humidity"],
+            item.get("pop", 0), item.get("rain", {}).get("3h", 0), item["wind"]["speed"], item["clouds"]["all"]
+        ))
+        icons.append(weather["icon"])
+        descriptions.append(weather["description"])
+
+    (timestamps, temps, temp_mins, temp_maxs, humidities,
+     pops, rains, winds, clouds) = np.array(rows, dtype=np.float64).T
+    timestamps = timestamps.astype(np.int64)
+    day_index = _local_day_index(timestamps)
+
+    # Groupes (localisation, jour local), triés de manière stable
+    order = np.lexsort((day_index, location))
+    group_keys = np.stack((location[order], day_index[order]), axis=1)
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = np.any(group_keys[1:] != group_keys[:-1], axis=1)
+    group_starts = np.flatnonzero(is_start)
+    group_sizes = np.diff(np.append(group_starts, len(order)))
+    n_groups = len(group_starts)
+    width = int(group_sizes.max())
+    groups = np.repeat(np.arange(n_groups), group_sizes)
+
+    def padded(values, fill=0.0):
+        return _padded(values[order], group_starts, group_sizes, n_groups, width, fill)
+
+    def first_arg(matrix, func):
+        # Indice (dans items) de la première occurrence de l'extrême, pour renvoyer la valeur d'origine
+        return order[group_starts + func(matrix, axis=1)].tolist()
+
+    temp_means = (_sequential_sum(padded(temps)) / group_sizes).tolist()
+    humidity_means = (_sequential_sum(padded(humidities)) / group_sizes).tolist()
+    cloud_means = (_sequential_sum(padded(clouds)) / group_sizes).tolist()
+    rain_totals = _sequential_sum(padded(rains)).tolist()
+    rain_is_float = np.fromiter((isinstance(row[6], float) for row in rows), dtype=bool, count=len(rows))
+    rain_has_float = np.logical_or.reduceat(rain_is_float[order], group_starts).tolist()
+
+    temp_min_at = first_arg(padded(temp_mins, np.inf), np.argmin)
+    temp_max_at = first_arg(padded(temp_maxs, -np.inf), np.argmax)
+    pop_max_at = first_arg(padded(pops, -np.inf), np.argmax)
+    wind_max_at = first_arg(padded(winds, -np.inf), np.argmax)
+
+    icon_labels, icon_codes = _encode(icons)
+    description_labels, description_codes = _encode(descriptions)
+    icon_modes = _modes(icon_codes[order], groups, n_groups).tolist()
+    description_modes = _modes(description_codes[order], groups, n_groups).tolist()
+
+    # Date et libellé calculés une fois par jour local (partagés entre localisations)
+    first_entries = order[group_starts]
+    group_locations = location[first_entries].tolist()
+    group_days = day_index[first_entries].tolist()
+    group_timestamps = timestamps[first_entries].tolist()
+    day_labels = {}
+
+    for g in range(n_groups):
+        forecasts = results[group_locations[g]]
+        if len(forecasts) >= MAX_FORECAST_DAYS:
+            continue
+
+        if group_days[g] not in day_labels:
+            dt = datetime.fromtimestamp(group_timestamps[g])
+            day_labels[group_days[g]] = (dt.strftime("%Y-%m-%d"), day_name(dt))
+        date_str, label = day_labels[group_days[g]]
+
+        rain_mm = rain_totals[g] if rain_has_float[g] else int(rain_totals[g])
+
+        forecasts.append({
+            "date": date_str,
+            "day_name": label,
+            "temp": round(temp_means[g], 1),
+            "temp_min": round(rows[temp_min_at[g]][2], 1),
+            "temp_max": round(rows[temp_max_at[g]][3], 1),
+            "humidity": round(humidity_means[g]),
+            "description": description_labels[description_modes[g]].capitalize(),
+            "icon": icon_labels[icon_modes[g]],
+            "rain_probability": round(rows[pop_max_at[g]][5] * 100),
+            "rain_mm": round(rain_mm, 1),
+            "wind_speed": round(rows[wind_max_at[g]][7] * 3.6, 1),
+            "clouds": round(cloud_means[g])
+        })
+
+    return results
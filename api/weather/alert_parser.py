@@ -0,0 +1,126 @@
+# weather/alert_parser.py
+
+import json
+
+# Caractères significatifs autorisés juste après une accolade ouvrante / une chaîne
+AFTER_OPEN = '"}'
+AFTER_STRING = ':,}]'
+
+
+class AlertStreamParser:
+    """
+    Parseur JSON incrémental pour la réponse de Gemini, reçue morceau par morceau.
+
+    Chaque objet alerte ({"id": ..., "severity": ..., ...}) est renvoyé dès que son
+    accolade fermante arrive, sans attendre la fin de la génération. Le texte
+    autour du JSON (prose, balises ```json, accolades parasites) est ignoré.
+
+    Une accolade de la prose ouvre un objet qui ne peut pas être du JSON : dès que
+    c'est visible (caractère impossible à cet endroit, saut de ligne brut dans une
+    chaîne, objet externe refusé par json.loads), il est abandonné et l'analyse
+    reprend à l'accolade suivante.
+    """
+
+    REQUIRED_KEYS = ("id", "severity")
+
+    def __init__(self):
+        self._buffer = []  # texte depuis l'accolade ouvrante de l'objet externe
+        self._starts = []  # positions des accolades ouvrantes non fermées
+        self._in_string = False
+        self._escaped = False
+        self._expected = None  # caractères attendus après "{" ou une chaîne
+        self._seen_ids = set()
+        # Vrai une fois l'objet englobant {"alerts": [...]} entièrement reçu
+        self.complete = False
+
+    def feed(self, text):
+        """Ajoute un morceau de texte et renvoie les alertes complétées par ce morceau"""
+        completed = []
+        while text:
+            text = self._scan(text, completed)
+        return completed
+
+    def _scan(self, text, completed):
+        """Analyse text ; renvoie le texte à réanalyser si l'objet externe est abandonné"""
+        for index, char in enumerate(text):
+            position = len(self._buffer)
+            self._buffer.append(char)
+
+            if self._in_string:
+                if char == "\n":
+                    # Saut de ligne brut interdit dans une chaîne JSON : l'objet ouvert était de la prose
+                    return self._restart(text[index + 1:])
+                elif self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._expected = AFTER_STRING
+                continue
+
+            if not self._starts:
+                # Hors de tout objet : les guillemets de la prose ne comptent pas
+                if char == "{":
+                    self._starts.append(position)
+                    self._expected = AFTER_OPEN
+                else:
+                    self._buffer.clear()
+                continue
+
+            if self._expected is not None and not char.isspace():
+                if char not in self._expected:
+                    # Ex. guillemet parasite : les chaînes sont décalées d'un cran
+                    return self._restart(text[index + 1:])
+                self._expected = None
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._starts.append(position)
+                self._expected = AFTER_OPEN
+            elif char == "}":
+                start = self._starts.pop()
+                try:
+                    alert = self._parse_object(start)
+                except ValueError:
+                    if not self._starts:
+                        return self._restart(text[index + 1:])
+                    alert = None
+                if alert is not None:
+                    completed.append(alert)
+                if not self._starts:
+                    self._buffer.clear()
+
+        return ""
+
+    def _restart(self, rest):
+        """Abandonne l'objet externe et renvoie le texte qui suit son accolade ouvrante"""
+        text = "".join(self._buffer[1:]) + rest
+        self._buffer.clear()
+        self._starts.clear()
+        self._in_string = False
+        self._escaped = False
+        self._expected = None
+        return text
+
+    def _parse_object(self, start):
+        """Alerte complète ou None ; ValueError si l'objet n'est pas du JSON"""
+        candidate = "".join(self._buffer[start:])
+        if self._starts and '"severity"' not in candidate and '"alerts"' not in candidate:
+            # Objet imbriqué sans intérêt : inutile de le décoder
+            return None
+
+        alert = json.loads(candidate)
+        if not isinstance(alert, dict):
+            return None
+        if "alerts" in alert:
+            self.complete = True
+            return None
+        if not all(key in alert for key in self.REQUIRED_KEYS):
+            return None
+        if alert["id"] in self._seen_ids:
+            return None
+
+        self._seen_ids.add(alert["id"])
+        return alert
@@ -0,0 +1,72 @@
+# weather/management/commands/bench_forecast_aggregation.py
+
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.services import WeatherService
+
+ICONS = ["01d", "02d", "03d", "04d", "09d", "10d", "10n", "11d"]
+DESCRIPTIONS = ["ciel dégagé", "peu nuageux", "nuageux", "couvert", "légère pluie", "pluie modérée", "orage"]
+
+
+def _fake_forecast(start_ts, rng):
+    """Génère une réponse "list" /forecast synthétique (40 pas de 3 h)"""
+    items = []
+    for step in range(40):
+        temp = round(rng.uniform(20, 36), 2)
+        item = {
+            "dt": start_ts + step * 3 * 3600,
+            "main": {
+                "temp": temp,
+                "temp_min": round(temp - rng.uniform(0, 2), 2),
+                "temp_max": round(temp + rng.uniform(0, 2), 2),
+                "humidity": rng.randint(40, 100),
+            },
+            "weather": [{"description": rng.choice(DESCRIPTIONS), "icon": rng.choice(ICONS)}],
+            "clouds": {"all": rng.randint(0, 100)},
+            "wind": {"speed": round(rng.uniform(0, 12), 2)},
+            "pop": rng.choice([0, round(rng.random(), 2)]),
+        }
+        if rng.random() < 0.4:
+            item["rain"] = {"3h": round(rng.uniform(0, 15), 2)}
+        items.append(item)
+    return items
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark : agrégation des prévisions par localisation vs agrégation vectorisée"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--locations", type=int, default=500, help="Nombre de localisations simulées")
+        parser.add_argument("--repeat", type=int, default=5, help="Nombre de répétitions (meilleur temps retenu)")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        start_ts = int(time.time()) // 10800 * 10800
+        forecast_lists = [_fake_forecast(start_ts, rng) for _ in range(options["locations"])]
+
+        def best_of(func):
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                result = func()
+                timings.append(time.perf_counter() - started)
+            return min(timings), result
+
+        scalar_time, scalar = best_of(
+            lambda: [WeatherService._aggregate_forecast(items) for items in forecast_lists]
+        )
+        batch_time, batch = best_of(lambda: WeatherService.aggregate_forecasts_batch(forecast_lists))
+
+        if scalar != batch:
+            raise CommandError("Les deux agrégations ne produisent pas le même résultat")
+
+        self.stdout.write(f"Localisations : {options['locations']} x {len(forecast_lists[0])} pas")
+        self.stdout.write(f"Par localisation : {scalar_time * 1000:.1f} ms")
+        self.stdout.write(f"Vectorisé        : {batch_time * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"Résultats identiques, accélération x{scalar_time / batch_time:.1f}"
+        ))
@@ -0,0 +1,79 @@
+# weather/management/commands/bench_json_rendering.py
+
+import json
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from gemini_api.fastjson import sse_event
+from weather.services import WeatherService
+
+LATITUDE = 5.3599517
+LONGITUDE = -4.0082563
+
+
+def _sample_weather():
+    """Résultat météo réaliste (5 jours, alertes statiques) pour remplir le cache"""
+    forecast = [{
+        "date": f"2026-10-{19 + day}",
+        "day_name": "Lundi",
+        "temp": 28.4,
+        "temp_min": 23.1,
+        "temp_max": 36.2,
+        "humidity": 88,
+        "description": "Pluie modérée",
+        "icon": "10d",
+        "rain_probability": 80,
+        "rain_mm": 12.5,
+        "wind_speed": 18.7,
+        "clouds": 75
+    } for day in range(5)]
+    current = {
+        "temperature": 31.2, "feels_like": 35.0, "temp_min": 23.1, "temp_max": 36.2,
+        "humidity": 88, "pressure": 1010, "description": "Nuageux", "icon": "04d", "main": "Clouds",
+        "wind_speed": 18.7, "wind_direction": 220, "clouds": 75, "visibility": 10.0,
+        "rain_1h": 0, "rain_3h": 0, "sunrise": "06:12", "sunset": "18:19"
+    }
+    alerts = WeatherService._generate_agricultural_alerts_static(current, forecast)
+    return WeatherService._build_result(LATITUDE, LONGITUDE, "Abidjan", current, forecast, alerts)
+
+
+class Command(BaseCommand):
+    help = "Requêtes/s sur un cache hit météo et coût de l'encodage SSE, avec et sans le rendu rapide"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Requêtes par mesure")
+        parser.add_argument("--chunks", type=int, default=50000, help="Trames SSE encodées")
+
+    def handle(self, *args, **options):
+        cache_key = WeatherService.cache_key(LATITUDE, LONGITUDE)
+        WeatherService._cache_result(cache_key, _sample_weather())
+        url = f"/api/weather/coordinates/?latitude={LATITUDE}&longitude={LONGITUDE}"
+
+        for label, fast in (("Rendu DRF (avant)", False), ("Rendu rapide (après)", True)):
+            with override_settings(FAST_JSON_RESPONSES=fast):
+                client = Client()
+                client.get(url)  # préchauffage (pré-sérialisation)
+                started = time.perf_counter()
+                for _ in range(options["requests"]):
+                    response = client.get(url)
+                elapsed = time.perf_counter() - started
+            assert response.status_code == 200
+            self.stdout.write(f"{label:<22} {options['requests'] / elapsed:8.0f} req/s  "
+                              f"({len(response.content)} octets)")
+
+        texts = ["Ton cacao a besoin d'un traitement préventif contre la pourriture brune. "] * options["chunks"]
+        started = time.perf_counter()
+        for text in texts:
+            f"data: {json.dumps({'text': text})}\n\n".encode()
+        json_time = time.perf_counter() - started
+        started = time.perf_counter()
+        for text in texts:
+            sse_event({"text": text})
+        fast_time = time.perf_counter() - started
+        self.stdout.write(f"Trames SSE : json {json_time / options['chunks'] * 1e6:.2f} µs, "
+                          f"orjson {fast_time / options['chunks'] * 1e6:.2f} µs")
+
+        cache.delete_many([cache_key, f"{cache_key}:version"])
@@ -0,0 +1,123 @@
+# weather/management/commands/precompute_alerts.py
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.services import WeatherService
+from weather.tiles import tile_center, tiles_in_bbox
+
+# Emprise de la Côte d'Ivoire (degrés)
+CIV_BBOX = (4.3, -8.7, 10.8, -2.4)  # lat_min, lon_min, lat_max, lon_max
+
+
+def _init_worker():
+    # Processus "spawn" : Django n'est pas encore configuré dans le worker
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gemini_api.settings")
+        django.setup()
+
+
+def _evaluate_tile(job):
+    """Exécuté dans un processus du pool : météo actuelle + alertes d'une tuile"""
+    tile_id, current_data, forecast = job
+    current = WeatherService._parse_current_weather(current_data, forecast=forecast)
+    alerts = WeatherService._generate_agricultural_alerts_static(current, forecast)
+    return tile_id, current, alerts
+
+
+class Command(BaseCommand):
+    help = "Précalcule la météo et les alertes de toutes les tuiles de la grille nationale"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bbox", type=float, nargs=4, default=CIV_BBOX,
+                            metavar=("LAT_MIN", "LON_MIN", "LAT_MAX", "LON_MAX"),
+                            help="Emprise à couvrir (Côte d'Ivoire par défaut)")
+        parser.add_argument("--concurrency", type=int, default=8,
+                            help="Appels OpenWeatherMap simultanés")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Processus pour l'évaluation des alertes")
+        parser.add_argument("--every", type=int, default=0,
+                            help="Relance toutes les N secondes (0 = une seule passe)")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["workers"] < 1:
+            raise CommandError("--concurrency et --workers doivent être positifs")
+
+        tiles = tiles_in_bbox(*options["bbox"])
+        if not tiles:
+            raise CommandError("Emprise vide")
+
+        while True:
+            self._run(tiles, options)
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
+
+    def _run(self, tiles, options):
+        timings = {}
+        started = time.perf_counter()
+
+        # 1. Téléchargement borné (E/S : threads)
+        raw = {}
+        failed = {}
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            futures = {executor.submit(self._fetch_tile, tile_id): tile_id for tile_id in tiles}
+            for future in as_completed(futures):
+                tile_id = futures[future]
+                try:
+                    raw[tile_id] = future.result()
+                except Exception as e:
+                    failed[tile_id] = e
+        timings["téléchargement"] = time.perf_counter() - started
+
+        # 2. Agrégation vectorisée des prévisions de toutes les tuiles
+        step = time.perf_counter()
+        tile_ids = list(raw)
+        forecasts = WeatherService.aggregate_forecasts_batch([raw[tile_id][0] for tile_id in tile_ids])
+        timings["agrégation"] = time.perf_counter() - step
+
+        # 3. Évaluation des alertes sur tous les cœurs (CPU : processus)
+        step = time.perf_counter()
+        jobs = [(tile_id, raw[tile_id][1], forecast) for tile_id, forecast in zip(tile_ids, forecasts)]
+        evaluated = {}
+        if jobs:
+            chunksize = max(len(jobs) // (options["workers"] * 4), 1)
+            with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as executor:
+                for tile_id, current, alerts in executor.map(_evaluate_tile, jobs, chunksize=chunksize):
+                    evaluated[tile_id] = (current, alerts)
+        timings["alertes"] = time.perf_counter() - step
+
+        # 4. Écriture dans le cache partagé
+        step = time.perf_counter()
+        results = {}
+        for tile_id, forecast in zip(tile_ids, forecasts):
+            current, alerts = evaluated[tile_id]
+            lat, lon = tile_center(tile_id)
+            results[tile_id] = WeatherService._build_result(lat, lon, None, current, forecast, alerts)
+        if results:
+            WeatherService.store_tiles_weather(results)
+        timings["cache"] = time.perf_counter() - step
+
+        total = time.perf_counter() - started
+        coverage = len(results) / len(tiles) * 100
+        self.stdout.write(f"Tuiles : {len(results)}/{len(tiles)} précalculées ({coverage:.1f} %), "
+                          f"{len(failed)} en échec, {total:.1f} s")
+        self.stdout.write("  " + ", ".join(f"{name} {duration:.2f} s" for name, duration in timings.items()))
+        for tile_id, error in list(failed.items())[:5]:
+            self.stderr.write(f"  {tile_id} : {error}")
+        if len(failed) > 5:
+            self.stderr.write(f"  ... et {len(failed) - 5} autre(s)")
+
+    @staticmethod
+    def _fetch_tile(tile_id):
+        lat, lon = tile_center(tile_id)
+        return (
+            WeatherService._fetch_forecast_items(lat, lon),
+            WeatherService._fetch_current_data(lat, lon),
+        )
@@ -0,0 +1,128 @@
+# weather/payloads.py
+
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from gemini_api import fastjson
+from gemini_api.profiling import stage
+
+from .services import ALERT_CATALOG, WeatherService
+
+# À incrémenter à chaque changement de structure de la réponse météo
+PAYLOAD_VERSION = 1
+
+PROJECTABLE_FIELDS = ("location", "current", "forecast", "alerts", "updated_at")
+
+# Exclu du hash : change à chaque rafraîchissement même si les données sont identiques
+VOLATILE_FIELDS = ("updated_at",)
+
+
+def parse_fields(raw_fields):
+    """
+    Transforme "current,alerts" en tuple de champs valides.
+    Renvoie None si aucune projection n'est demandée.
+    """
+    if not raw_fields:
+        return None
+
+    fields = tuple(field.strip() for field in raw_fields.split(",") if field.strip())
+    unknown = [field for field in fields if field not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Champs inconnus : {', '.join(unknown)}")
+
+    return fields
+
+
+def compact_alerts(alerts):
+    """
+    Remplace titre et recommandations par une référence au catalogue
+    lorsque l'alerte correspond exactement à une entrée du catalogue.
+    """
+    compacted = []
+    for alert in alerts:
+        entry = ALERT_CATALOG.get(alert.get("id"))
+        if (
+            entry
+            and alert.get("title") == entry["title"]
+            and alert.get("recommendations") == entry["recommendations"]
+        ):
+            compacted.append({
+                "id": alert["id"],
+                "severity": alert.get("severity", entry["severity"]),
+                "message": alert.get("message", "")
+            })
+        else:
+            compacted.append(alert)
+    return compacted
+
+
+def build_weather_payload(weather_data, fields=None, compact=False):
+    """Réponse météo versionnée, avec projection de champs et alertes compactes"""
+    payload = {"version": PAYLOAD_VERSION}
+
+    for field in fields or PROJECTABLE_FIELDS:
+        if field in weather_data:
+            payload[field] = weather_data[field]
+
+    if compact and "alerts" in payload:
+        payload["alerts"] = compact_alerts(payload["alerts"])
+
+    return payload
+
+
+def compute_etag(payload):
+    """ETag fort, stable pour un contenu identique (champs volatils ignorés)"""
+    stable = {key: value for key, value in payload.items() if key not in VOLATILE_FIELDS}
+    encoded = json.dumps(stable, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+    return f'"v{PAYLOAD_VERSION}-{digest}"'
+
+
+def etag_matches(request, etag):
+    """Vrai si l'en-tête If-None-Match du client contient déjà cet ETag"""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    # ETag envoyés sous forme faible (W/"...") : comparaison faible, suffisante pour un GET
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def catalog_payload():
+    """Catalogue des textes d'alertes, à mettre en cache côté client"""
+    return {"version": PAYLOAD_VERSION, "alerts": ALERT_CATALOG}
+
+
+def render_weather_payload(weather_data, fields=None, compact=False):
+    """(ETag, octets JSON) d'une réponse météo"""
+    with stage("render"):
+        payload = build_weather_payload(weather_data, fields=fields, compact=compact)
+        return compute_etag(payload), fastjson.dumps(payload)
+
+
+def get_rendered_weather(latitude, longitude, location_name=None, fields=None, compact=False):
+    """
+    Réponse météo pré-sérialisée : sur un cache hit, les octets JSON et l'ETag
+    sont relus tels quels, sans reconstruire ni re-sérialiser le dictionnaire.
+    La clé inclut la version des données, donc un rafraîchissement l'invalide.
+    """
+    variant = f"{','.join(fields) if fields else '*'}:{int(compact)}"
+
+    def render_key(version):
+        return f"{WeatherService.cache_key(latitude, longitude)}:render:{version}:{variant}"
+
+    version = WeatherService.cache_version(latitude, longitude)
+    if version is not None:
+        rendered = cache.get(render_key(version))
+        if rendered is not None:
+            return rendered
+
+    weather_data = WeatherService.get_weather_for_location(latitude, longitude, location_name)
+    rendered = render_weather_payload(weather_data, fields=fields, compact=compact)
+    cache.set(render_key(weather_data["updated_at"]), rendered, WeatherService.CACHE_TIMEOUT)
+    return rendered
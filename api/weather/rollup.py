@@ -0,0 +1,142 @@
+# weather/rollup.py
+
+from .payloads import PAYLOAD_VERSION
+from .services import ALERT_CATALOG
+from .sync import SYNC_MAX_COLD_TILES, fetch_tile_bundles
+from .tiles import bbox_tile_count, polygon_bbox, tile_for, tiles_in_polygon
+
+# Synthèse des alertes pour une coopérative : les parcelles (ou un polygone)
+# sont ramenées aux tuiles de la grille, chaque tuile est lue une seule fois
+# depuis les bundles en cache, puis les alertes sont cumulées par type du
+# catalogue. Les tuiles absentes du cache au-delà de ROLLUP_MAX_COLD_TILES
+# sont renvoyées dans "pending" plutôt que calculées dans la requête.
+
+MAX_ROLLUP_PLOTS = 2000
+MAX_POLYGON_VERTICES = 500
+MAX_ROLLUP_TILES = 1000
+# Tuiles de l'emprise d'un polygone testées une à une (un polygone en diagonale
+# couvre moins de tuiles que son emprise, d'où la marge)
+MAX_POLYGON_BBOX_TILES = 2 * MAX_ROLLUP_TILES
+ROLLUP_MAX_COLD_TILES = SYNC_MAX_COLD_TILES
+
+# Alertes hors catalogue (ids libres de Gemini) : regroupées dans un seul type
+OTHER_ALERT_TYPE = "other"
+OTHER_ALERT_TITLE = "Autres alertes"
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3}
+
+
+def parse_polygon(raw_polygon):
+    """[[latitude, longitude], ...] -> [(latitude, longitude)], ValueError sinon"""
+    if not isinstance(raw_polygon, list) or not 3 <= len(raw_polygon) <= MAX_POLYGON_VERTICES:
+        raise ValueError(f"Le polygone doit compter de 3 à {MAX_POLYGON_VERTICES} sommets [latitude, longitude]")
+
+    polygon = []
+    for vertex in raw_polygon:
+        try:
+            latitude, longitude = float(vertex[0]), float(vertex[1])
+        except (TypeError, ValueError, IndexError, KeyError):
+            raise ValueError("Chaque sommet du polygone doit être [latitude, longitude]")
+        if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+            raise ValueError("Coordonnées GPS invalides dans le polygone")
+        polygon.append((latitude, longitude))
+
+    if polygon[0] == polygon[-1]:
+        polygon.pop()  # polygone fermé (GeoJSON) : dernier sommet en double
+    return polygon
+
+
+def alert_type(alert):
+    """
+    Type du catalogue d'une alerte : id exact, id préfixé par un type
+    ("heavy_rain_abidjan") ou titre du catalogue ; "other" sinon.
+    """
+    alert_id = alert.get("id") or ""
+    if alert_id in ALERT_CATALOG:
+        return alert_id
+    for catalog_id, entry in ALERT_CATALOG.items():
+        if alert_id.startswith(catalog_id) or alert.get("title") == entry["title"]:
+            return catalog_id
+    return OTHER_ALERT_TYPE
+
+
+def build_rollup(plots=None, polygon=None):
+    """
+    Une ligne par type d'alerte : pire sévérité, tuiles et parcelles touchées.
+    Avec un polygone, il n'y a pas de parcelles : seules les tuiles sont comptées.
+    """
+    by_plots = plots is not None
+    if by_plots:
+        plots_by_tile = {}
+        for plot_id, latitude, longitude in plots:
+            plots_by_tile.setdefault(tile_for(latitude, longitude), []).append(plot_id)
+    else:
+        # Refus avant toute énumération : le nombre de tuiles de l'emprise se calcule directement
+        bbox_tiles = bbox_tile_count(*polygon_bbox(polygon))
+        if bbox_tiles > MAX_POLYGON_BBOX_TILES:
+            raise ValueError(
+                f"Zone trop étendue : l'emprise du polygone couvre {bbox_tiles} tuiles "
+                f"(maximum {MAX_POLYGON_BBOX_TILES})"
+            )
+        plots_by_tile = {tile_id: [] for tile_id in tiles_in_polygon(polygon)}
+
+    if len(plots_by_tile) > MAX_ROLLUP_TILES:
+        raise ValueError(f"Zone trop étendue : {len(plots_by_tile)} tuiles couvertes (maximum {MAX_ROLLUP_TILES})")
+
+    rollup = {}
+    pending = []
+    errors = {}
+    fetched_tiles = fetch_tile_bundles(list(plots_by_tile), max_cold=ROLLUP_MAX_COLD_TILES)
+    for tile_id, fetched in fetched_tiles.items():
+        if fetched is None:
+            pending.append(tile_id)
+            continue
+        if isinstance(fetched, Exception):
+            errors[tile_id] = "Données météo indisponibles"
+            continue
+
+        for alert in fetched[1]["alerts"]:
+            type_id = alert_type(alert)
+            entry = rollup.get(type_id)
+            if entry is None:
+                title = ALERT_CATALOG[type_id]["title"] if type_id in ALERT_CATALOG else OTHER_ALERT_TITLE
+                entry = rollup[type_id] = {
+                    "id": type_id,
+                    "title": title,
+                    "worst_severity": None,
+                    "affected_tiles": []
+                }
+                if by_plots:
+                    entry["affected_plots"] = []
+
+            severity = alert.get("severity")
+            if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(entry["worst_severity"], 0):
+                entry["worst_severity"] = severity
+            # Une tuile peut porter deux alertes du même type (ids Gemini différents)
+            if entry["affected_tiles"] and entry["affected_tiles"][-1] == tile_id:
+                continue
+            entry["affected_tiles"].append(tile_id)
+            if by_plots:
+                entry["affected_plots"].extend(plots_by_tile[tile_id])
+
+    for entry in rollup.values():
+        entry["tile_count"] = len(entry["affected_tiles"])
+        if by_plots:
+            entry["plot_count"] = len(entry["affected_plots"])
+
+    count_field = "plot_count" if by_plots else "tile_count"
+    alerts = sorted(
+        rollup.values(),
+        key=lambda entry: (-SEVERITY_RANK.get(entry["worst_severity"], 0), -entry[count_field], entry["id"])
+    )
+
+    result = {"version": PAYLOAD_VERSION, "tiles": len(plots_by_tile)}
+    if by_plots:
+        result["plots"] = len(plots)
+    result["alerts"] = alerts
+    if pending:
+        # Pas encore en cache : à redemander une fois calculées
+        result["pending"] = pending
+    if errors:
+        result["errors"] = errors
+    return result
@@ -1,31 +1,101 @@
 # weather/services.py
 
 import requests
-import json
 import logging
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from collections import Counter
 from datetime import datetime, timedelta
 
+from gemini_api.profiling import stage, timed_iter
+
+from .alert_parser import AlertStreamParser
+from .tiles import tile_center, tile_for
+
 logger = logging.getLogger(__name__)
 
+# Textes fixes des alertes statiques, servis aussi comme catalogue au client
+# (le client peut résoudre titre et recommandations à partir de l'id)
+ALERT_CATALOG = {
+    "heavy_rain": {
+        "severity": "high",
+        "title": "Fortes pluies prévues",
+        "recommendations": [
+            "Reporter les traitements phytosanitaires",
+            "Vérifier le drainage des parcelles",
+            "Protéger les jeunes plants",
+            "Éviter les applications d'engrais foliaires"
+        ]
+    },
+    "drought": {
+        "severity": "medium",
+        "title": "Période sèche prolongée",
+        "recommendations": [
+            "Prévoir l'irrigation si possible",
+            "Pailler le sol pour conserver l'humidité",
+            "Surveiller les signes de stress hydrique",
+            "Arroser tôt le matin ou tard le soir"
+        ]
+    },
+    "heat_wave": {
+        "severity": "high",
+        "title": "Températures élevées",
+        "recommendations": [
+            "Augmenter la fréquence d'irrigation",
+            "Ombrager les cultures sensibles si possible",
+            "Éviter les travaux physiques aux heures chaudes",
+            "Surveiller les signes de flétrissement"
+        ]
+    },
+    "strong_wind": {
+        "severity": "medium",
+        "title": "Vents forts prévus",
+        "recommendations": [
+            "Tutorer les plantes hautes",
+            "Reporter les traitements par pulvérisation",
+            "Protéger les jeunes plants",
+            "Vérifier la solidité des structures"
+        ]
+    },
+    "high_humidity": {
+        "severity": "medium",
+        "title": "Humidité élevée - Risque de maladies",
+        "recommendations": [
+            "Surveiller l'apparition de maladies fongiques",
+            "Espacer les plants pour améliorer l'aération",
+            "Éviter l'arrosage en soirée",
+            "Envisager un traitement préventif si nécessaire"
+        ]
+    },
+    "optimal": {
+        "severity": "low",
+        "title": "Conditions favorables",
+        "recommendations": [
+            "Bon moment pour planter",
+            "Conditions idéales pour les traitements",
+            "Période propice aux récoltes",
+            "Profitez-en pour les travaux de terrain"
+        ]
+    }
+}
+
 
 class WeatherService:
     """Service de gestion de la météo agricole"""
 
     OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
     CACHE_TIMEOUT = 1800  # 30 minutes
+    TILE_CACHE_ALIAS = "tiles"  # cache partagé des tuiles précalculées
 
     @classmethod
     def get_weather_for_location(cls, latitude, longitude, location_name=None):
         """
         Récupère la météo complète pour une localisation
         """
-        cache_key = f"weather_{latitude}_{longitude}"
-        cached_data = cache.get(cache_key)
+        cache_key = cls.cache_key(latitude, longitude)
+        cached_data = cls.get_cached_weather(latitude, longitude, location_name)
 
         if cached_data:
-            logger.info(f"Cache hit pour {cache_key}")
             return cached_data
 
         try:
@@ -41,19 +111,9 @@ class WeatherService:
                 forecast
             )
 
-            result = {
-                "location": {
-                    "name": location_name or "Votre position",
-                    "latitude": latitude,
-                    "longitude": longitude
-                },
-                "current": current_weather,
-                "forecast": forecast,
-                "alerts": alerts,
-                "updated_at": datetime.now().isoformat()
-            }
+            result = cls._build_result(latitude, longitude, location_name, current_weather, forecast, alerts)
 
-            cache.set(cache_key, result, cls.CACHE_TIMEOUT)
+            cls._cache_result(cache_key, result)
             logger.info(f"Données météo mises en cache pour {cache_key}")
 
             return result
@@ -62,9 +122,153 @@ class WeatherService:
             logger.error(f"Erreur récupération météo: {e}", exc_info=True)
             raise
 
+    @classmethod
+    def refresh_tile_weather(cls, tile_id):
+        """
+        Recalcule la météo au centre d'une tuile avec les alertes à base de règles
+        (ids du catalogue, stables d'un calcul à l'autre, sans appel Gemini)
+        et l'écrit dans le cache des tuiles.
+        """
+        latitude, longitude = tile_center(tile_id)
+        forecast = cls._get_forecast(latitude, longitude)
+        current_weather = cls._get_current_weather(latitude, longitude, forecast=forecast)
+        alerts = cls._generate_agricultural_alerts_static(current_weather, forecast)
+
+        result = cls._build_result(latitude, longitude, None, current_weather, forecast, alerts)
+        cls.store_tiles_weather({tile_id: result})
+        return result
+
+    @classmethod
+    def get_cached_weather(cls, latitude, longitude, location_name=None):
+        """
+        Météo en cache pour ce point : cache local exact, sinon tuile précalculée
+        (commande precompute_alerts) ramenée à la position demandée.
+        """
+        cache_key = cls.cache_key(latitude, longitude)
+        cached_data = cache.get(cache_key)
+        if cached_data:
+            logger.info(f"Cache hit pour {cache_key}")
+            return cached_data
+
+        tile_id = tile_for(latitude, longitude)
+        tile_data = cls.get_tile_weather(tile_id)
+        if not tile_data:
+            return None
+
+        logger.info(f"Tuile précalculée {tile_id} utilisée pour {cache_key}")
+        result = {
+            **tile_data,
+            "location": {
+                "name": location_name or "Votre position",
+                "latitude": latitude,
+                "longitude": longitude
+            }
+        }
+
+        # Copie locale pour les hits suivants, sans dépasser l'expiration de la tuile
+        age = (datetime.now() - datetime.fromisoformat(tile_data["updated_at"])).total_seconds()
+        cls._cache_result(cache_key, result, timeout=max(cls.CACHE_TIMEOUT - age, 60))
+        return result
+
+    @classmethod
+    def has_cached_weather(cls, latitude, longitude):
+        """Vrai si une réponse peut être servie sans appel OpenWeatherMap"""
+        if cls.cache_version(latitude, longitude) is not None:
+            return True
+        tile_key = cls.tile_cache_key(tile_for(latitude, longitude))
+        return caches[cls.TILE_CACHE_ALIAS].has_key(tile_key)
+
+    @classmethod
+    def cache_key(cls, latitude, longitude):
+        return f"weather_{latitude}_{longitude}"
+
+    @classmethod
+    def tile_cache_key(cls, tile_id):
+        return f"weather_tile_{tile_id}"
+
+    @classmethod
+    def get_tile_weather(cls, tile_id):
+        """Résultat précalculé d'une tuile (cache partagé entre processus)"""
+        return caches[cls.TILE_CACHE_ALIAS].get(cls.tile_cache_key(tile_id))
+
+    @classmethod
+    def store_tiles_weather(cls, results_by_tile, timeout=None):
+        """Écrit les résultats précalculés de plusieurs tuiles dans le cache partagé"""
+        caches[cls.TILE_CACHE_ALIAS].set_many(
+            {cls.tile_cache_key(tile_id): result for tile_id, result in results_by_tile.items()},
+            timeout or cls.CACHE_TIMEOUT
+        )
+
+    @classmethod
+    def cache_version(cls, latitude, longitude):
+        """
+        Version (updated_at) des données en cache, sans relire tout le résultat.
+        Sert à invalider les réponses pré-sérialisées (voir payloads.get_rendered_weather).
+        """
+        return cache.get(f"{cls.cache_key(latitude, longitude)}:version")
+
+    @classmethod
+    def _cache_result(cls, cache_key, result, timeout=None):
+        cache.set_many({
+            cache_key: result,
+            f"{cache_key}:version": result["updated_at"]
+        }, timeout or cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def stream_weather_for_location(cls, latitude, longitude, location_name=None):
+        """
+        Variante progressive de get_weather_for_location, sous forme d'événements :
+            ("weather", données sans alertes)  dès que current et forecast sont connus
+            ("alert", alerte)                  pour chaque alerte, au fil de la génération
+            ("done", résultat complet)         une fois le résultat mis en cache
+        """
+        cache_key = cls.cache_key(latitude, longitude)
+        cached_data = cls.get_cached_weather(latitude, longitude, location_name)
+
+        if cached_data:
+            yield "weather", {key: value for key, value in cached_data.items() if key != "alerts"}
+            for alert in cached_data["alerts"]:
+                yield "alert", alert
+            yield "done", cached_data
+            return
+
+        forecast = cls._get_forecast(latitude, longitude)
+        current_weather = cls._get_current_weather(latitude, longitude, forecast=forecast)
+
+        result = cls._build_result(latitude, longitude, location_name, current_weather, forecast, [])
+        yield "weather", {key: value for key, value in result.items() if key != "alerts"}
+
+        for alert in cls.iter_agricultural_alerts(location_name or "Votre position", current_weather, forecast):
+            result["alerts"].append(alert)
+            yield "alert", alert
+
+        cls._cache_result(cache_key, result)
+        logger.info(f"Données météo mises en cache pour {cache_key}")
+        yield "done", result
+
+    @classmethod
+    def _build_result(cls, latitude, longitude, location_name, current_weather, forecast, alerts):
+        """Structure de la réponse météo complète (mise en cache)"""
+        return {
+            "location": {
+                "name": location_name or "Votre position",
+                "latitude": latitude,
+                "longitude": longitude
+            },
+            "current": current_weather,
+            "forecast": forecast,
+            "alerts": alerts,
+            "updated_at": datetime.now().isoformat()
+        }
+
     @classmethod
     def _get_current_weather(cls, lat, lon, forecast=None):
         """Récupère la météo actuelle via OpenWeatherMap"""
+        return cls._parse_current_weather(cls._fetch_current_data(lat, lon), forecast=forecast)
+
+    @classmethod
+    def _fetch_current_data(cls, lat, lon):
+        """Réponse brute de /weather"""
         api_key = settings.OPENWEATHER_API_KEY
         url = f"{cls.OPENWEATHER_BASE_URL}/weather"
 
@@ -76,10 +280,14 @@ class WeatherService:
             "lang": "fr"
         }
 
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        with stage("openweathermap"):
+            response = requests.get(url, params=params, timeout=10)
+            response.raise_for_status()
+            return response.json()
 
+    @classmethod
+    def _parse_current_weather(cls, data, forecast=None):
+        """Météo actuelle à partir de la réponse /weather"""
         # Utilisation des vraies min/max du jour depuis le forecast si disponible
         today_min = forecast[0]["temp_min"] if forecast else data["main"]["temp_min"]
         today_max = forecast[0]["temp_max"] if forecast else data["main"]["temp_max"]
@@ -107,6 +315,11 @@ class WeatherService:
     @classmethod
     def _get_forecast(cls, lat, lon):
         """Récupère et agrège les prévisions sur 5 jours"""
+        return cls._aggregate_forecast(cls._fetch_forecast_items(lat, lon))
+
+    @classmethod
+    def _fetch_forecast_items(cls, lat, lon):
+        """Prévisions 3-horaires brutes (champ "list" de /forecast)"""
         api_key = settings.OPENWEATHER_API_KEY
         url = f"{cls.OPENWEATHER_BASE_URL}/forecast"
 
@@ -118,13 +331,17 @@ class WeatherService:
             "lang": "fr"
         }
 
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        with stage("openweathermap"):
+            response = requests.get(url, params=params, timeout=10)
+            response.raise_for_status()
+            return response.json()["list"]
 
+    @classmethod
+    def _aggregate_forecast(cls, items):
+        """Agrège les prévisions 3-horaires d'une localisation par jour"""
         daily_data = {}
 
-        for item in data["list"]:
+        for item in items:
             dt = datetime.fromtimestamp(item["dt"])
             date_str = dt.strftime("%Y-%m-%d")
 
@@ -164,8 +381,9 @@ class WeatherService:
         for date_str in sorted_dates:
             day = daily_data[date_str]
 
-            dominant_icon = max(set(day["icons"]), key=day["icons"].count)
-            dominant_description = max(set(day["descriptions"]), key=day["descriptions"].count).capitalize()
+            # Valeur la plus fréquente ; en cas d'égalité, la première rencontrée
+            dominant_icon = Counter(day["icons"]).most_common(1)[0][0]
+            dominant_description = Counter(day["descriptions"]).most_common(1)[0][0].capitalize()
 
             daily_forecasts.append({
                 "date": date_str,
@@ -185,15 +403,26 @@ class WeatherService:
         return daily_forecasts
 
     @classmethod
-    def _generate_agricultural_alerts_with_gemini(cls, location_name, current, forecast):
-        """Génère des alertes via Gemini avec fallback sur version statique"""
+    def aggregate_forecasts_batch(cls, forecast_lists):
+        """
+        Agrégation vectorisée (NumPy) des prévisions de plusieurs localisations.
+        Résultat identique à _aggregate_forecast appliqué à chaque liste.
+        """
+        # NumPy n'est chargé que par ce chemin (précalcul, benchmarks)
+        from .aggregation import aggregate_forecasts
+
+        return aggregate_forecasts(forecast_lists, cls._get_day_name)
+
+    @classmethod
+    def _build_alerts_prompt(cls, location_name, current, forecast):
+        """Prompt envoyé à Gemini pour générer les alertes agricoles"""
         forecast_summary = "\n".join([
             f"- {day['day_name']} ({day['date']}): {day['temp_min']}–{day['temp_max']}°C, "
             f"humidité {day['humidity']}%, pluie {day['rain_probability']}%, vent {day['wind_speed']} km/h"
             for day in forecast
         ])
 
-        prompt = f"""
+        return f"""
 Tu es un expert agronome spécialisé en agriculture tropicale en Côte d'Ivoire.
 Analyse les données météo ci-dessous et génère entre 0 et 6 alertes agricoles pertinentes pour les cultures principales : cacao, riz, manioc, café, igname, banane plantain.
 
@@ -226,30 +455,55 @@ Prévisions 5 jours :
 {forecast_summary}
 """
 
+    @classmethod
+    def _iter_gemini_alert_chunks(cls, prompt):
+        """
+        Texte généré par Gemini, morceau par morceau. Appel direct dans le
+        processus (requête isolée, sans session de chat) plutôt qu'un aller-retour
+        HTTP vers /api/chat/stream/, qui occupait un second créneau d'admission.
+        """
+        # Import tardif : le client Gemini n'est chargé qu'au premier appel
+        from chat.views import generate_once
+
+        response, model_name = generate_once(prompt, stream=True)
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    @classmethod
+    def iter_agricultural_alerts(cls, location_name, current, forecast):
+        """
+        Génère les alertes via Gemini et les renvoie une par une, dès que chaque
+        objet JSON est complet dans le flux. Fallback sur la version statique.
+        """
+        prompt = cls._build_alerts_prompt(location_name, current, forecast)
+        parser = AlertStreamParser()
+        count = 0
+
         try:
-            chat_response = requests.post(
-                "http://localhost:8000/api/chat/",  # À adapter si URL différente en prod
-                json={"message": prompt},
-                timeout=30
-            )
-            chat_response.raise_for_status()
-            gemini_output = chat_response.json().get("response", "")  # Adaptez selon ta structure de réponse
+            for chunk in timed_iter("gemini_alerts", cls._iter_gemini_alert_chunks(prompt)):
+                for alert in parser.feed(chunk):
+                    count += 1
+                    yield alert
 
-            # Extraction du JSON (Gemini peut ajouter du texte autour)
-            start = gemini_output.find("{")
-            end = gemini_output.rfind("}") + 1
-            if start == -1 or end == 0:
+            if count == 0 and not parser.complete:
                 raise ValueError("Aucun JSON trouvé dans la réponse Gemini")
-            json_str = gemini_output[start:end]
-            alerts_data = json.loads(json_str)
-            alerts = alerts_data.get("alerts", [])
 
-            logger.info(f"Alertes générées par Gemini : {len(alerts)} alerte(s)")
-            return alerts
+            logger.info(f"Alertes générées par Gemini : {count} alerte(s)")
 
         except Exception as e:
+            if count:
+                # Des alertes ont déjà été envoyées : on s'arrête là
+                logger.error(f"Flux Gemini interrompu après {count} alerte(s) : {e}")
+                return
+
             logger.error(f"Échec génération alertes Gemini : {e}. Utilisation du fallback statique.")
-            return cls._generate_agricultural_alerts_static(current, forecast)
+            yield from cls._generate_agricultural_alerts_static(current, forecast)
+
+    @classmethod
+    def _generate_agricultural_alerts_with_gemini(cls, location_name, current, forecast):
+        """Génère des alertes via Gemini avec fallback sur version statique"""
+        return list(cls.iter_agricultural_alerts(location_name, current, forecast))
 
     @classmethod
     def _generate_agricultural_alerts_static(cls, current, forecast):
@@ -258,98 +512,62 @@ Prévisions 5 jours :
 
         heavy_rain_days = [day for day in forecast if day["rain_probability"] > 70]
         if heavy_rain_days:
-            alerts.append({
-                "id": "heavy_rain",
-                "severity": "high",
-                "title": "Fortes pluies prévues",
-                "message": f"Risque de pluie élevé dans les {len(heavy_rain_days)} prochains jours.",
-                "recommendations": [
-                    "Reporter les traitements phytosanitaires",
-                    "Vérifier le drainage des parcelles",
-                    "Protéger les jeunes plants",
-                    "Éviter les applications d'engrais foliaires"
-                ]
-            })
+            alerts.append(cls._catalog_alert(
+                "heavy_rain",
+                f"Risque de pluie élevé dans les {len(heavy_rain_days)} prochains jours."
+            ))
 
         dry_days = [day for day in forecast if day["rain_probability"] < 20]
         if len(dry_days) >= 3 and current["rain_1h"] == 0:
-            alerts.append({
-                "id": "drought",
-                "severity": "medium",
-                "title": "Période sèche prolongée",
-                "message": f"Pas de pluie significative prévue sur {len(dry_days)} jours.",
-                "recommendations": [
-                    "Prévoir l'irrigation si possible",
-                    "Pailler le sol pour conserver l'humidité",
-                    "Surveiller les signes de stress hydrique",
-                    "Arroser tôt le matin ou tard le soir"
-                ]
-            })
+            alerts.append(cls._catalog_alert(
+                "drought",
+                f"Pas de pluie significative prévue sur {len(dry_days)} jours."
+            ))
 
         hot_days = [day for day in forecast if day["temp_max"] > 35]
         if hot_days or current["temperature"] > 35:
-            alerts.append({
-                "id": "heat_wave",
-                "severity": "high",
-                "title": "Températures élevées",
-                "message": "Forte chaleur attendue. Risque de stress thermique pour les cultures.",
-                "recommendations": [
-                    "Augmenter la fréquence d'irrigation",
-                    "Ombrager les cultures sensibles si possible",
-                    "Éviter les travaux physiques aux heures chaudes",
-                    "Surveiller les signes de flétrissement"
-                ]
-            })
+            alerts.append(cls._catalog_alert(
+                "heat_wave",
+                "Forte chaleur attendue. Risque de stress thermique pour les cultures."
+            ))
 
         windy_days = [day for day in forecast if day["wind_speed"] > 40]
         if windy_days or current["wind_speed"] > 40:
-            alerts.append({
-                "id": "strong_wind",
-                "severity": "medium",
-                "title": "Vents forts prévus",
-                "message": "Risque de dommages mécaniques aux cultures.",
-                "recommendations": [
-                    "Tutorer les plantes hautes",
-                    "Reporter les traitements par pulvérisation",
-                    "Protéger les jeunes plants",
-                    "Vérifier la solidité des structures"
-                ]
-            })
+            alerts.append(cls._catalog_alert(
+                "strong_wind",
+                "Risque de dommages mécaniques aux cultures."
+            ))
 
         humid_days = [day for day in forecast if day["humidity"] > 85]
         if len(humid_days) >= 2 or current["humidity"] > 85:
-            alerts.append({
-                "id": "high_humidity",
-                "severity": "medium",
-                "title": "Humidité élevée - Risque de maladies",
-                "message": "Conditions favorables au développement de champignons.",
-                "recommendations": [
-                    "Surveiller l'apparition de maladies fongiques",
-                    "Espacer les plants pour améliorer l'aération",
-                    "Éviter l'arrosage en soirée",
-                    "Envisager un traitement préventif si nécessaire"
-                ]
-            })
+            alerts.append(cls._catalog_alert(
+                "high_humidity",
+                "Conditions favorables au développement de champignons."
+            ))
 
         if not alerts:
             optimal_days = [day for day in forecast[:3]
                             if 20 < day["temp_max"] < 32 and 30 < day["rain_probability"] < 60 and day["wind_speed"] < 30]
             if optimal_days:
-                alerts.append({
-                    "id": "optimal",
-                    "severity": "low",
-                    "title": "Conditions favorables",
-                    "message": "Bonnes conditions pour les travaux agricoles.",
-                    "recommendations": [
-                        "Bon moment pour planter",
-                        "Conditions idéales pour les traitements",
-                        "Période propice aux récoltes",
-                        "Profitez-en pour les travaux de terrain"
-                    ]
-                })
+                alerts.append(cls._catalog_alert(
+                    "optimal",
+                    "Bonnes conditions pour les travaux agricoles."
+                ))
 
         return alerts
 
+    @classmethod
+    def _catalog_alert(cls, alert_id, message):
+        """Construit une alerte à partir des textes du catalogue"""
+        entry = ALERT_CATALOG[alert_id]
+        return {
+            "id": alert_id,
+            "severity": entry["severity"],
+            "title": entry["title"],
+            "message": message,
+            "recommendations": list(entry["recommendations"])
+        }
+
     @classmethod
     def _get_day_name(cls, dt):
         days = {0: "Lundi", 1: "Mardi", 2: "Mercredi", 3: "Jeudi", 4: "Vendredi", 5: "Samedi", 6: "Dimanche"}
@@ -0,0 +1,127 @@
+# weather/subscriptions.py
+
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+from .services import WeatherService
+
+logger = logging.getLogger(__name__)
+
+# Champs comparés pour décider qu'une alerte a changé
+ALERT_DIFF_FIELDS = ("severity", "title", "message", "recommendations")
+
+
+def diff_alerts(previous, current):
+    """
+    Compare deux listes d'alertes (par id).
+    Renvoie {"added": [...], "changed": [...], "cleared": [ids]}.
+    """
+    previous_by_id = {alert.get("id"): alert for alert in previous or []}
+    current_by_id = {alert.get("id"): alert for alert in current or []}
+
+    added = [alert for alert_id, alert in current_by_id.items() if alert_id not in previous_by_id]
+    changed = [
+        alert for alert_id, alert in current_by_id.items()
+        if alert_id in previous_by_id and any(
+            alert.get(field) != previous_by_id[alert_id].get(field) for field in ALERT_DIFF_FIELDS
+        )
+    ]
+    cleared = [alert_id for alert_id in previous_by_id if alert_id not in current_by_id]
+
+    return {"added": added, "changed": changed, "cleared": cleared}
+
+
+def is_empty_diff(diff):
+    return not (diff["added"] or diff["changed"] or diff["cleared"])
+
+
+class AlertHub:
+    """
+    Abonnements aux alertes par tuile, dans le processus courant.
+    Garde le dernier instantané des alertes de chaque tuile et diffuse
+    les différences à tous les abonnés de la tuile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._snapshots = {}
+
+    def subscribe(self, tile_id):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(tile_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, tile_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(tile_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                # Plus personne n'écoute : la tuile n'est plus rafraîchie
+                del self._subscribers[tile_id]
+                self._snapshots.pop(tile_id, None)
+
+    def subscribed_tiles(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def snapshot(self, tile_id):
+        with self._lock:
+            return self._snapshots.get(tile_id)
+
+    def publish(self, tile_id, alerts):
+        """Enregistre le nouvel instantané et pousse le diff aux abonnés s'il n'est pas vide"""
+        with self._lock:
+            diff = diff_alerts(self._snapshots.get(tile_id), alerts)
+            self._snapshots[tile_id] = alerts
+            subscribers = list(self._subscribers.get(tile_id, ()))
+
+        if not is_empty_diff(diff):
+            event = {"tile": tile_id, **diff}
+            for subscriber in subscribers:
+                subscriber.put(event)
+            logger.info(f"Alertes modifiées pour la tuile {tile_id} : {len(subscribers)} abonné(s) notifié(s)")
+
+        return diff
+
+
+alert_hub = AlertHub()
+
+_refresher_lock = threading.Lock()
+_refresher = None
+
+
+def refresh_tile(tile_id):
+    """
+    Recalcule la météo de la tuile et diffuse le diff des alertes.
+    Alertes à base de règles : Gemini réécrit ids et textes à chaque génération,
+    le diff signalerait tout comme supprimé puis ajouté à chaque rafraîchissement.
+    """
+    weather_data = WeatherService.refresh_tile_weather(tile_id)
+    return alert_hub.publish(tile_id, weather_data["alerts"])
+
+
+def _refresh_loop():
+    while True:
+        time.sleep(settings.WEATHER_ALERTS_REFRESH_INTERVAL)
+        for tile_id in alert_hub.subscribed_tiles():
+            try:
+                refresh_tile(tile_id)
+            except Exception as e:
+                logger.error(f"Échec du rafraîchissement de la tuile {tile_id}: {e}")
+
+
+def ensure_refresher_started():
+    """Démarre (une seule fois par processus) le rafraîchissement périodique des tuiles abonnées"""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_loop, name="weather-alerts-refresher", daemon=True)
+            _refresher.start()
@@ -0,0 +1,205 @@
+# weather/sync.py
+
+import base64
+import binascii
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from django.core.cache import cache
+
+from gemini_api import fastjson
+
+from .payloads import PAYLOAD_VERSION, catalog_payload, compact_alerts, compute_etag
+from .services import WeatherService
+from .tiles import tile_center, tile_for
+
+logger = logging.getLogger(__name__)
+
+# Bundle hors ligne de l'application mobile : pour chaque tuile des parcelles,
+# résumé météo + alertes actives, et le catalogue des textes d'alertes.
+# Le jeton de synchronisation est sans état côté serveur : il contient le
+# hash de chaque tuile déjà reçue par le client et celui du catalogue.
+
+MAX_PLOTS = 200
+SYNC_WORKERS = 4  # tuiles absentes du cache calculées en parallèle
+SYNC_MAX_COLD_TILES = 8  # tuiles absentes du cache calculées par requête, les autres sont "pending"
+
+CURRENT_SUMMARY_FIELDS = (
+    "temperature", "humidity", "description", "icon", "wind_speed", "rain_1h", "sunrise", "sunset"
+)
+FORECAST_SUMMARY_FIELDS = (
+    "date", "day_name", "temp_min", "temp_max", "description", "icon", "rain_probability", "rain_mm"
+)
+
+CATALOG_HASH = compute_etag(catalog_payload()).strip('"')
+
+
+def parse_plots(raw_plots, max_plots=MAX_PLOTS):
+    """
+    Valide [{"id": ..., "latitude": ..., "longitude": ...}, ...] et renvoie
+    [(id, latitude, longitude)]. Lève ValueError avec un message pour le client.
+    """
+    if not isinstance(raw_plots, list) or not raw_plots:
+        raise ValueError("Le champ 'plots' doit être une liste non vide")
+    if len(raw_plots) > max_plots:
+        raise ValueError(f"Maximum {max_plots} parcelles par requête")
+
+    plots = []
+    for index, plot in enumerate(raw_plots):
+        if not isinstance(plot, dict):
+            raise ValueError(f"Parcelle {index} invalide")
+        try:
+            latitude = float(plot["latitude"])
+            longitude = float(plot["longitude"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Parcelle {index} : 'latitude' et 'longitude' sont requis")
+        if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+            raise ValueError(f"Parcelle {index} : coordonnées GPS invalides")
+        plots.append((plot.get("id", index), latitude, longitude))
+    return plots
+
+
+def encode_token(tile_hashes, catalog_hash):
+    raw = fastjson.dumps({"v": PAYLOAD_VERSION, "c": catalog_hash, "t": tile_hashes})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token):
+    """
+    (hash par tuile, hash du catalogue) connus du client. Jeton absent,
+    illisible ou d'une autre version : synchronisation complète.
+    """
+    if not token:
+        return {}, None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = orjson.loads(raw)
+    except (binascii.Error, ValueError):
+        return {}, None
+    if not isinstance(data, dict) or data.get("v") != PAYLOAD_VERSION or not isinstance(data.get("t"), dict):
+        return {}, None
+    return data["t"], data.get("c")
+
+
+def build_tile_bundle(tile_id, weather_data):
+    """Résumé d'une tuile pour le mode hors ligne (alertes du catalogue par id)"""
+    current = weather_data["current"]
+    return {
+        "tile": tile_id,
+        "current": {field: current[field] for field in CURRENT_SUMMARY_FIELDS if field in current},
+        "forecast": [
+            {field: day[field] for field in FORECAST_SUMMARY_FIELDS if field in day}
+            for day in weather_data["forecast"]
+        ],
+        "alerts": compact_alerts(weather_data["alerts"]),
+        "updated_at": weather_data["updated_at"]
+    }
+
+
+def _bundle_for(tile_id, weather_data):
+    """
+    (hash, bundle) d'une tuile, construit une seule fois par version des
+    données météo et partagé par tous les utilisateurs de la tuile.
+    """
+    latitude, longitude = tile_center(tile_id)
+    bundle_key = f"{WeatherService.cache_key(latitude, longitude)}:bundle:{weather_data['updated_at']}"
+    cached = cache.get(bundle_key)
+    if cached is not None:
+        return cached
+
+    bundle = build_tile_bundle(tile_id, weather_data)
+    stable = {key: value for key, value in bundle.items() if key != "updated_at"}
+    digest = hashlib.sha256(fastjson.dumps(stable)).hexdigest()[:16]
+    cache.set(bundle_key, (digest, bundle), WeatherService.CACHE_TIMEOUT)
+    return digest, bundle
+
+
+def _cold_tile_bundle(tile_id):
+    # Calcul à base de règles (OpenWeatherMap seulement, jamais Gemini), partagé via le cache des tuiles
+    return _bundle_for(tile_id, WeatherService.refresh_tile_weather(tile_id))
+
+
+def fetch_tile_bundles(tile_ids, max_cold=SYNC_MAX_COLD_TILES):
+    """
+    {tuile: (hash, bundle), l'exception rencontrée, ou None si en attente}.
+
+    Les tuiles en cache (ou précalculées) sont servies telles quelles. Au plus
+    max_cold tuiles absentes sont calculées, en parallèle ; les suivantes
+    restent en attente (None) pour une prochaine requête.
+    """
+    results = {}
+    cold = []
+    for tile_id in tile_ids:
+        weather_data = WeatherService.get_cached_weather(*tile_center(tile_id))
+        if weather_data:
+            results[tile_id] = _bundle_for(tile_id, weather_data)
+        elif len(cold) < max_cold:
+            cold.append(tile_id)
+        else:
+            results[tile_id] = None
+
+    if cold:
+        with ThreadPoolExecutor(max_workers=min(SYNC_WORKERS, len(cold))) as executor:
+            futures = {tile_id: executor.submit(_cold_tile_bundle, tile_id) for tile_id in cold}
+
+        for tile_id, future in futures.items():
+            try:
+                results[tile_id] = future.result()
+            except Exception as e:
+                logger.error(f"Tuile {tile_id} indisponible ({e})")
+                results[tile_id] = e
+
+    return {tile_id: results[tile_id] for tile_id in tile_ids}
+
+
+def build_sync_bundle(plots, since=None):
+    """
+    Réponse de synchronisation : tuiles modifiées depuis le jeton `since`,
+    liste des tuiles inchangées et catalogue seulement s'il a changé.
+    """
+    known_hashes, known_catalog = decode_token(since)
+
+    plot_tiles = [{"id": plot_id, "tile": tile_for(latitude, longitude)} for plot_id, latitude, longitude in plots]
+    tile_ids = list(dict.fromkeys(plot["tile"] for plot in plot_tiles))
+
+    tiles = {}
+    unchanged = []
+    pending = []
+    errors = {}
+    tile_hashes = {}
+    for tile_id, fetched in fetch_tile_bundles(tile_ids).items():
+        if fetched is None or isinstance(fetched, Exception):
+            if fetched is None:
+                pending.append(tile_id)
+            else:
+                errors[tile_id] = "Données météo indisponibles"
+            # Le client garde sa copie : l'ancien hash reste dans le jeton
+            if tile_id in known_hashes:
+                tile_hashes[tile_id] = known_hashes[tile_id]
+            continue
+
+        digest, bundle = fetched
+        tile_hashes[tile_id] = digest
+        if known_hashes.get(tile_id) == digest:
+            unchanged.append(tile_id)
+        else:
+            tiles[tile_id] = bundle
+
+    result = {
+        "version": PAYLOAD_VERSION,
+        "token": encode_token(tile_hashes, CATALOG_HASH),
+        "full": not known_hashes,
+        "plots": plot_tiles,
+        "tiles": tiles,
+        "unchanged": unchanged,
+    }
+    if known_catalog != CATALOG_HASH:
+        result["catalog"] = catalog_payload()["alerts"]
+    if pending:
+        # Pas encore calculées : renvoyées lors d'une prochaine synchronisation
+        result["pending"] = pending
+    if errors:
+        result["errors"] = errors
+    return result
@@ -1,3 +1,76 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .alert_parser import AlertStreamParser
+
+ALERTS = [
+    {
+        "id": "fortes_pluies",
+        "severity": "high",
+        "title": "🌧️ Fortes pluies",
+        "message": "Jusqu'à 40 mm {demain}",
+        "recommendations": ["Vérifier le drainage", "Reporter les traitements"]
+    },
+    {
+        "id": "humidite",
+        "severity": "medium",
+        "title": "💧 Humidité élevée",
+        "message": "Risque de \"black pod\" sur le cacao",
+        "recommendations": ["Surveiller les cabosses"]
+    }
+]
+
+COMPACT = json.dumps({"alerts": ALERTS}, ensure_ascii=False)
+PRETTY = json.dumps({"alerts": ALERTS}, ensure_ascii=False, indent=2)
+
+
+def parse(text, chunk_size=None):
+    """(ids des alertes renvoyées, complete) pour un texte découpé en morceaux"""
+    parser = AlertStreamParser()
+    chunk_size = chunk_size or len(text)
+    ids = []
+    for offset in range(0, len(text), chunk_size):
+        ids.extend(alert["id"] for alert in parser.feed(text[offset:offset + chunk_size]))
+    return ids, parser.complete
+
+
+class AlertStreamParserTests(SimpleTestCase):
+    expected = (["fortes_pluies", "humidite"], True)
+
+    def test_compact(self):
+        self.assertEqual(parse(COMPACT), self.expected)
+
+    def test_pretty_printed(self):
+        self.assertEqual(parse(PRETTY), self.expected)
+
+    def test_fenced(self):
+        self.assertEqual(parse(f"Voici les alertes :\n```json\n{PRETTY}\n```\nBonne saison !"), self.expected)
+
+    def test_character_by_character(self):
+        for text in (COMPACT, PRETTY):
+            self.assertEqual(parse(text, chunk_size=1), self.expected)
+
+    def test_alert_sent_before_end_of_stream(self):
+        parser = AlertStreamParser()
+        end_of_first = COMPACT.index("}", COMPACT.index("recommendations")) + 1
+        alerts = parser.feed(COMPACT[:end_of_first])
+        self.assertEqual([alert["id"] for alert in alerts], ["fortes_pluies"])
+        self.assertFalse(parser.complete)
+
+    def test_stray_quote_before_compact_json(self):
+        self.assertEqual(parse(f'Note "{{" : {COMPACT}'), self.expected)
+        self.assertEqual(parse(f'Note "{{" : {COMPACT}', chunk_size=7), self.expected)
+
+    def test_stray_quote_and_newline(self):
+        self.assertEqual(parse(f'Note : {{ "cacao" est "sensible\n{PRETTY}'), self.expected)
+
+    def test_stray_braces_in_prose(self):
+        self.assertEqual(parse(f"Analyse {{rapide}} puis {{ détaillée : {COMPACT}"), self.expected)
+
+    def test_duplicate_ids_sent_once(self):
+        ids, _ = parse(COMPACT + COMPACT)
+        self.assertEqual(ids, ["fortes_pluies", "humidite"])
+
+    def test_no_json(self):
+        self.assertEqual(parse("Désolé, je ne peux pas répondre { pour le moment."), ([], False))
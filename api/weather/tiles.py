@@ -0,0 +1,76 @@
+# weather/tiles.py
+
+import math
+
+# Taille d'une tuile météo en degrés (~28 km à l'équateur), assez fine pour
+# les prévisions OpenWeatherMap et assez grossière pour mutualiser les calculs
+TILE_SIZE = 0.25
+
+
+def tile_for(latitude, longitude):
+    """Identifiant de la tuile contenant le point, ex. "5.375_-4.125" (centre de la tuile)"""
+    lat_center = (math.floor(latitude / TILE_SIZE) + 0.5) * TILE_SIZE
+    lon_center = (math.floor(longitude / TILE_SIZE) + 0.5) * TILE_SIZE
+    return f"{lat_center:.3f}_{lon_center:.3f}"
+
+
+def tile_center(tile_id):
+    """Coordonnées (latitude, longitude) du centre d'une tuile"""
+    lat, lon = tile_id.split("_")
+    return float(lat), float(lon)
+
+
+def _bbox_indices(lat_min, lon_min, lat_max, lon_max):
+    lat_range = range(math.floor(lat_min / TILE_SIZE), math.ceil(lat_max / TILE_SIZE))
+    lon_range = range(math.floor(lon_min / TILE_SIZE), math.ceil(lon_max / TILE_SIZE))
+    return lat_range, lon_range
+
+
+def bbox_tile_count(lat_min, lon_min, lat_max, lon_max):
+    """Nombre de tuiles couvrant l'emprise, sans les énumérer"""
+    lat_range, lon_range = _bbox_indices(lat_min, lon_min, lat_max, lon_max)
+    return len(lat_range) * len(lon_range)
+
+
+def tiles_in_bbox(lat_min, lon_min, lat_max, lon_max):
+    """Identifiants des tuiles couvrant l'emprise"""
+    tiles = []
+    lat_range, lon_range = _bbox_indices(lat_min, lon_min, lat_max, lon_max)
+    for lat_index in lat_range:
+        for lon_index in lon_range:
+            tiles.append(tile_for((lat_index + 0.5) * TILE_SIZE, (lon_index + 0.5) * TILE_SIZE))
+    return tiles
+
+
+def point_in_polygon(latitude, longitude, polygon):
+    """Lancer de rayon ; polygon = [(latitude, longitude), ...] non fermé"""
+    inside = False
+    count = len(polygon)
+    for index in range(count):
+        lat_a, lon_a = polygon[index]
+        lat_b, lon_b = polygon[index - 1]
+        if (lat_a > latitude) != (lat_b > latitude):
+            crossing = lon_a + (latitude - lat_a) / (lat_b - lat_a) * (lon_b - lon_a)
+            if longitude < crossing:
+                inside = not inside
+    return inside
+
+
+def polygon_bbox(polygon):
+    """(lat_min, lon_min, lat_max, lon_max) du polygone"""
+    lats = [lat for lat, _ in polygon]
+    lons = [lon for _, lon in polygon]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def tiles_in_polygon(polygon):
+    """
+    Tuiles dont le centre est dans le polygone. Un polygone plus petit
+    qu'une tuile est rattaché aux tuiles de ses sommets.
+    Vérifier bbox_tile_count(*polygon_bbox(polygon)) avant l'appel.
+    """
+    tiles = [
+        tile_id for tile_id in tiles_in_bbox(*polygon_bbox(polygon))
+        if point_in_polygon(*tile_center(tile_id), polygon)
+    ]
+    return tiles or list(dict.fromkeys(tile_for(lat, lon) for lat, lon in polygon))
@@ -4,11 +4,21 @@ from django.urls import path
 from .views import (
     WeatherByCoordinatesView,
     WeatherByCityView,
-    WeatherTestView
+    WeatherSyncView,
+    WeatherRollupView,
+    WeatherTestView,
+    AlertCatalogView,
+    WeatherAlertsStreamView,
+    WeatherStreamView
 )
 
 urlpatterns = [
     path('coordinates/', WeatherByCoordinatesView.as_view(), name='weather_coordinates'),
+    path('stream/', WeatherStreamView.as_view(), name='weather_stream'),
     path('city/', WeatherByCityView.as_view(), name='weather_city'),
+    path('sync/', WeatherSyncView.as_view(), name='weather_sync'),
+    path('rollup/', WeatherRollupView.as_view(), name='weather_rollup'),
     path('test/', WeatherTestView.as_view(), name='weather_test'),
+    path('alerts/catalog/', AlertCatalogView.as_view(), name='weather_alert_catalog'),
+    path('alerts/stream/', WeatherAlertsStreamView.as_view(), name='weather_alerts_stream'),
 ]
\ No newline at end of file
@@ -3,13 +3,50 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from .services import WeatherService
+from .payloads import (
+    build_weather_payload, catalog_payload, compute_etag, etag_matches, get_rendered_weather, parse_fields
+)
+from gemini_api.fastjson import FastJSONMixin, json_bytes_response, sse_event
+from .subscriptions import alert_hub, ensure_refresher_started, refresh_tile
+from .sync import build_sync_bundle, parse_plots
+from .rollup import MAX_ROLLUP_PLOTS, build_rollup, parse_polygon
+from .tiles import tile_for
+import queue
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class WeatherByCoordinatesView(APIView):
+def _with_etag(request, etag, conditional, build_response):
+    """Réponse avec ETag ; 304 sans corps si le client a déjà cette version"""
+    if conditional and etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build_response()
+
+    # Toujours sous forme faible : GZip affaiblit l'ETag des 200 compressés,
+    # le 304 (sans corps, jamais compressé) doit porter le même validateur
+    response["ETag"] = f"W/{etag}"
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def _conditional_response(request, payload, conditional):
+    return _with_etag(request, compute_etag(payload), conditional, lambda: Response(payload, status=status.HTTP_200_OK))
+
+
+def _conditional_bytes_response(request, etag, body, conditional):
+    # Octets JSON pré-sérialisés : ni rendu DRF ni json.dumps à chaque hit
+    return _with_etag(request, etag, conditional, lambda: json_bytes_response(body))
+
+
+@method_decorator(gzip_page, name="dispatch")
+class WeatherByCoordinatesView(FastJSONMixin, APIView):
     """
     Récupère la météo par coordonnées GPS
     
@@ -19,18 +56,45 @@ class WeatherByCoordinatesView(APIView):
         "longitude": -4.0082563,
         "location_name": "Abidjan" (optionnel)
     }
+
+    GET /api/weather/coordinates/?latitude=5.36&longitude=-4.01
+        GET conditionnel : renvoie 304 si If-None-Match correspond à l'ETag
+
+    Options (query string) :
+        ?fields=current,alerts   projection des champs renvoyés
+        ?compact=1               alertes du catalogue envoyées par id
+                                 (voir /api/weather/alerts/catalog/)
     """
     
+    def get(self, request):
+        return self._weather_response(
+            request,
+            request.query_params.get("latitude"),
+            request.query_params.get("longitude"),
+            request.query_params.get("location_name"),
+            conditional=True
+        )
+
     def post(self, request):
-        latitude = request.data.get("latitude")
-        longitude = request.data.get("longitude")
-        location_name = request.data.get("location_name")
-        
+        return self._weather_response(
+            request,
+            request.data.get("latitude"),
+            request.data.get("longitude"),
+            request.data.get("location_name")
+        )
+
+    def _weather_response(self, request, latitude, longitude, location_name, conditional=False):
         # Validation
         if latitude is None or longitude is None:
             return Response({
                 "error": "Les paramètres 'latitude' et 'longitude' sont requis"
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            fields = parse_fields(request.query_params.get("fields"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        compact = request.query_params.get("compact") in ("1", "true")
         
         try:
             # Convertir en float
@@ -44,14 +108,18 @@ class WeatherByCoordinatesView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Récupérer la météo
+            if settings.FAST_JSON_RESPONSES:
+                etag, body = get_rendered_weather(
+                    latitude, longitude, location_name, fields=fields, compact=compact
+                )
+                return _conditional_bytes_response(request, etag, body, conditional)
+
             weather_data = WeatherService.get_weather_for_location(
                 latitude, 
                 longitude, 
                 location_name
             )
             
-            return Response(weather_data, status=status.HTTP_200_OK)
-            
         except ValueError as e:
             logger.error(f"Erreur de validation: {e}")
             return Response({
@@ -65,8 +133,12 @@ class WeatherByCoordinatesView(APIView):
                 "details": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        payload = build_weather_payload(weather_data, fields=fields, compact=compact)
+        return _conditional_response(request, payload, conditional)
+
 
-class WeatherByCityView(APIView):
+@method_decorator(gzip_page, name="dispatch")
+class WeatherByCityView(FastJSONMixin, APIView):
     """
     Récupère la météo par nom de ville
     
@@ -102,6 +174,74 @@ class WeatherByCityView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@method_decorator(gzip_page, name="dispatch")
+class WeatherSyncView(FastJSONMixin, APIView):
+    """
+    Bundle hors ligne de l'application : météo résumée et alertes de chaque
+    tuile des parcelles, catalogue des alertes, en une seule réponse compressée.
+
+    POST /api/weather/sync/
+    Body: {
+        "plots": [{"id": "p1", "latitude": 5.36, "longitude": -4.01}, ...],
+        "since": "<token de la synchronisation précédente>" (optionnel)
+    }
+
+    Avec "since", seules les tuiles modifiées sont renvoyées dans "tiles" ;
+    les autres sont listées dans "unchanged" et "catalog" n'est renvoyé que
+    s'il a changé. Le client conserve le nouveau "token".
+
+    Les tuiles absentes du cache sont calculées (alertes à base de règles)
+    dans une limite par requête ; les suivantes sont listées dans "pending"
+    et arrivent à la synchronisation suivante.
+    """
+
+    def post(self, request):
+        try:
+            plots = parse_plots(request.data.get("plots"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = request.data.get("since")
+        if since is not None and not isinstance(since, str):
+            return Response({"error": "Le champ 'since' doit être un token"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(build_sync_bundle(plots, since=since), status=status.HTTP_200_OK)
+
+
+@method_decorator(gzip_page, name="dispatch")
+class WeatherRollupView(FastJSONMixin, APIView):
+    """
+    Alertes cumulées sur les parcelles d'une coopérative (ou une zone)
+
+    POST /api/weather/rollup/
+    Body: {"plots": [{"id": "p1", "latitude": 5.36, "longitude": -4.01}, ...]}
+      ou  {"polygon": [[5.2, -4.2], [5.6, -4.2], [5.6, -3.8], [5.2, -3.8]]}
+
+    Réponse : une entrée par type d'alerte du catalogue (les alertes hors
+    catalogue sont regroupées sous "other"), triée par gravité puis par nombre
+    de parcelles touchées, avec "worst_severity", "plot_count", "tile_count",
+    "affected_plots" (ids) et "affected_tiles". Avec un polygone, pas de champs
+    de parcelles : le tri se fait sur le nombre de tuiles. Les tuiles pas
+    encore en cache sont listées dans "pending".
+    """
+
+    def post(self, request):
+        try:
+            if request.data.get("plots") is not None:
+                plots = parse_plots(request.data.get("plots"), max_plots=MAX_ROLLUP_PLOTS)
+                rollup = build_rollup(plots=plots)
+            elif request.data.get("polygon") is not None:
+                rollup = build_rollup(polygon=parse_polygon(request.data.get("polygon")))
+            else:
+                return Response({
+                    "error": "Le champ 'plots' ou 'polygon' est requis"
+                }, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(rollup, status=status.HTTP_200_OK)
+
+
 class WeatherTestView(APIView):
     """
     Endpoint de test pour vérifier la configuration
@@ -129,4 +269,124 @@ class WeatherTestView(APIView):
                 "status": "error",
                 "message": "Erreur de configuration",
                 "details": str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(gzip_page, name="dispatch")
+class AlertCatalogView(FastJSONMixin, APIView):
+    """
+    Catalogue des titres et recommandations des alertes (mode ?compact=1)
+    
+    GET /api/weather/alerts/catalog/
+    """
+    
+    def get(self, request):
+        return _conditional_response(request, catalog_payload(), conditional=True)
+
+
+class WeatherAlertsStreamView(APIView):
+    """
+    Abonnement SSE aux changements d'alertes d'une tuile météo
+    
+    GET /api/weather/alerts/stream/?latitude=5.36&longitude=-4.01
+    
+    Premier événement : alertes actuelles de la tuile (dans "added").
+    Ensuite, à chaque rafraîchissement qui modifie les alertes :
+        data: {"tile": "...", "added": [...], "changed": [...], "cleared": ["id", ...]}
+    """
+    
+    def get(self, request):
+        try:
+            latitude = float(request.query_params.get("latitude"))
+            longitude = float(request.query_params.get("longitude"))
+        except (TypeError, ValueError):
+            return Response({
+                "error": "Les paramètres 'latitude' et 'longitude' sont requis"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+            return Response({
+                "error": "Coordonnées GPS invalides"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        tile_id = tile_for(latitude, longitude)
+
+        def event_stream():
+            subscriber = alert_hub.subscribe(tile_id)
+            ensure_refresher_started()
+            try:
+                snapshot = alert_hub.snapshot(tile_id)
+                if snapshot is not None:
+                    initial = {"tile": tile_id, "added": snapshot, "changed": [], "cleared": []}
+                    yield sse_event(initial)
+                else:
+                    try:
+                        # Premier abonné de la tuile : l'instantané initial est diffusé via la file
+                        refresh_tile(tile_id)
+                    except Exception as e:
+                        logger.error(f"Erreur récupération météo: {e}")
+                        yield sse_event({'error': 'Impossible de récupérer les données météo'})
+
+                while True:
+                    try:
+                        event = subscriber.get(timeout=settings.WEATHER_SSE_HEARTBEAT)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield sse_event(event)
+
+            finally:
+                alert_hub.unsubscribe(tile_id, subscriber)
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        return response
+
+
+class WeatherStreamView(APIView):
+    """
+    Météo en flux SSE : current et forecast immédiatement, puis les alertes
+    une par une au fil de leur génération par Gemini
+    
+    POST /api/weather/stream/
+    Body: {"latitude": 5.36, "longitude": -4.01, "location_name": "Abidjan" (optionnel)}
+    
+    Événements :
+        data: {"type": "weather", "location": ..., "current": ..., "forecast": ..., "updated_at": ...}
+        data: {"type": "alert", "alert": {...}}
+        data: [DONE]
+    """
+    
+    def post(self, request):
+        try:
+            latitude = float(request.data.get("latitude"))
+            longitude = float(request.data.get("longitude"))
+        except (TypeError, ValueError):
+            return Response({
+                "error": "Les paramètres 'latitude' et 'longitude' sont requis"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+            return Response({
+                "error": "Coordonnées GPS invalides"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        location_name = request.data.get("location_name")
+
+        def event_stream():
+            try:
+                for event_type, data in WeatherService.stream_weather_for_location(latitude, longitude, location_name):
+                    if event_type == "weather":
+                        yield sse_event({'type': 'weather', **data})
+                    elif event_type == "alert":
+                        yield sse_event({'type': 'alert', 'alert': data})
+
+                yield "data: [DONE]\n\n"
+
+            except Exception as e:
+                logger.error(f"Erreur récupération météo: {e}")
+                yield sse_event({'error': 'Impossible de récupérer les données météo'})
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        return response